@@ -0,0 +1,141 @@
+"""So sánh backend encode (torch fp32, onnx-int8, torch-int8): độ lệch cosine và tốc độ.
+
+Ví dụ:
+    python Benchmark/bench_embedding.py --backends onnx-int8 torch-int8 --output embed.json
+    python Benchmark/bench_embedding.py --db data/news_database.db --texts 2000
+
+Văn bản mẫu lấy từ ttp_table + news_table của --db (nếu có) hoặc sinh từ các mẫu tin nhắn lừa
+đảo. Với mỗi backend: thời gian load, latency encode từng câu (p50/p95), throughput khi encode
+theo batch, cosine giữa vector của backend và vector fp32, tỉ lệ giữ nguyên láng giềng gần nhất.
+"""
+import argparse
+import random
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from common import ROOT, percentile_ms, report_header, write_report
+
+sys.path.insert(0, ROOT)
+
+TEMPLATES = [
+    "Chúc mừng quý khách đã trúng thưởng {prize}, vui lòng truy cập {link} để nhận quà",
+    "Tài khoản ngân hàng {bank} của bạn bị khóa, xác thực ngay tại {link}",
+    "Cơ quan công an thông báo bạn liên quan đến vụ án, chuyển {amount} vào tài khoản tạm giữ",
+    "Tuyển cộng tác viên làm việc online, hoa hồng {amount} mỗi ngày, liên hệ Zalo {phone}",
+    "Gói vay nhanh không thế chấp {amount}, giải ngân trong 5 phút, gọi {phone}",
+    "Đơn hàng của bạn bị giữ tại kho, thanh toán phí {amount} để nhận hàng qua {link}",
+    "Mã OTP của bạn là {otp}, nhân viên {bank} sẽ gọi để xác nhận, vui lòng đọc mã",
+    "Điện lực thông báo cắt điện do chưa thanh toán {amount}, thanh toán tại {link}",
+    "Con bạn bị tai nạn đang cấp cứu, cần chuyển gấp {amount} vào số tài khoản {phone}",
+    "Đầu tư tiền ảo lợi nhuận {amount} mỗi tháng, cam kết không rủi ro, tham gia tại {link}",
+]
+FILLERS = {
+    "prize": ["xe máy SH", "iPhone 15", "50 triệu đồng", "chuyến du lịch Phú Quốc"],
+    "link": ["http://vcb-xacthuc.com", "bit.ly/nhanqua", "http://dichvucong-gov.vn", "shopee-hoantien.net"],
+    "bank": ["Vietcombank", "Techcombank", "BIDV", "MB Bank"],
+    "amount": ["500.000đ", "2 triệu", "15 triệu đồng", "200 USD"],
+    "phone": ["0901234567", "0987654321", "0912345678"],
+    "otp": ["123456", "908172", "554433"],
+}
+
+def synthetic_texts(n, seed=0):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(n):
+        template = rng.choice(TEMPLATES)
+        text = template.format(**{key: rng.choice(values) for key, values in FILLERS.items()})
+        # Trộn độ dài để kiểm tra batch theo độ dài câu
+        texts.append(text + (" " + text.lower()) * rng.randint(0, 3))
+    return texts
+
+def db_texts(db_path, n):
+    with sqlite3.connect(db_path) as conn:
+        texts = [f"{p} - {c}" for p, c in conn.execute("SELECT pattern, category FROM ttp_table")]
+        texts += [f"{t or ''}. {c or ''}" for t, c in conn.execute("SELECT title, content FROM news_table LIMIT ?", (n,))]
+    return texts[:n]
+
+def measure(encoder, texts, singles, batch_size):
+    single_latencies = []
+    for text in texts[:singles]:
+        start = time.perf_counter()
+        encoder.encode([text], batch_size=1, normalize_embeddings=True)
+        single_latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    embeddings = np.asarray(encoder.encode(texts, batch_size=batch_size, normalize_embeddings=True), dtype=np.float32)
+    batch_seconds = time.perf_counter() - start
+    return embeddings, {
+        "single_p50_ms": percentile_ms(single_latencies, 50),
+        "single_p95_ms": percentile_ms(single_latencies, 95),
+        "batch_seconds": round(batch_seconds, 3),
+        "throughput_texts_per_s": round(len(texts) / batch_seconds, 1),
+    }
+
+def parity(reference, embeddings):
+    cosine = (reference * embeddings).sum(axis=1)
+    # Láng giềng gần nhất (bỏ chính nó) của mỗi câu có giữ nguyên so với fp32 không
+    ref_sim = reference @ reference.T
+    new_sim = embeddings @ embeddings.T
+    np.fill_diagonal(ref_sim, -np.inf)
+    np.fill_diagonal(new_sim, -np.inf)
+    return {
+        "cosine_mean": round(float(cosine.mean()), 6),
+        "cosine_min": round(float(cosine.min()), 6),
+        "cosine_p01": round(float(np.percentile(cosine, 1)), 6),
+        "nearest_neighbor_agreement": round(float((ref_sim.argmax(1) == new_sim.argmax(1)).mean()), 4),
+    }
+
+def main():
+    from Database.model_registry import EMBEDDING_MODEL_NAME
+    from Database.quantized_encoder import EMBEDDING_BACKENDS, load_encoder
+    from Database.embedding_cache import normalize_text
+
+    parser = argparse.ArgumentParser(description="Parity và latency của các backend encode")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--backends", nargs="*", default=[b for b in EMBEDDING_BACKENDS if b != "torch"])
+    parser.add_argument("--db", help="Lấy văn bản mẫu từ database thật")
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--singles", type=int, default=100, help="Số câu đo latency encode từng câu")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="File JSON kết quả (mặc định in ra stdout)")
+    args = parser.parse_args()
+
+    texts = db_texts(args.db, args.texts) if args.db else synthetic_texts(args.texts, args.seed)
+    texts = [normalize_text(text) for text in texts]
+
+    results = []
+    reference = None
+    for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+        print(f"{backend}...", file=sys.stderr)
+        try:
+            start = time.perf_counter()
+            encoder = load_encoder(args.model, backend)
+            load_seconds = round(time.perf_counter() - start, 3)
+            encoder.encode(texts[:8], batch_size=8)  # warmup
+            embeddings, result = measure(encoder, texts, args.singles, args.batch_size)
+        except Exception as e:
+            results.append({"backend": backend, "error": f"{type(e).__name__}: {e}"})
+            continue
+        result = {"backend": backend, "load_seconds": load_seconds, **result}
+        if backend == "torch":
+            reference = embeddings
+        elif reference is not None:
+            result.update(parity(reference, embeddings))
+            base = results[0]
+            result["speedup_single_p50"] = round(base["single_p50_ms"] / result["single_p50_ms"], 2)
+            result["speedup_throughput"] = round(result["throughput_texts_per_s"] / base["throughput_texts_per_s"], 2)
+        results.append(result)
+
+    write_report({
+        **report_header(),
+        "model": args.model,
+        "texts": len(texts),
+        "batch_size": args.batch_size,
+        "results": results,
+    }, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Benchmark cho tầng truy xuất tin tức (search_bm25 + rerank_with_tfidf).
+
+Ví dụ:
+    python Benchmark/bench_retrieval.py --sizes 10000 100000 --output bench.json
+    python Benchmark/bench_retrieval.py --db data/news_database.db --backends memory fts5
+    python Benchmark/bench_retrieval.py --sizes 10000 --compare bench_old.json
+
+Mỗi cặp (corpus, backend) chạy trong một process riêng để đo peak RSS và thời gian build
+độc lập. Kết quả ghi ra JSON (kèm commit hiện tại) để so sánh giữa các commit.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from common import ROOT, percentile_ms, report_header, write_report
+
+DEFAULT_WORKDIR = os.path.join(tempfile.gettempdir(), "fense_bench")
+OUTLETS = [
+    "https://vnexpress.net", "https://congan.com.vn", "https://dantri.com.vn", "https://vtv.vn",
+    "https://antv.gov.vn", "https://cafef.vn", "https://nhandan.vn", "https://thanhnien.vn",
+]
+
+ONSETS = ["", "b", "c", "ch", "d", "đ", "g", "gh", "gi", "h", "k", "kh", "l", "m", "n", "ng",
+          "nh", "p", "ph", "qu", "r", "s", "t", "th", "tr", "v", "x"]
+VOWELS = ["a", "á", "à", "ả", "ã", "ạ", "ă", "ắ", "ằ", "â", "ấ", "ầ", "e", "é", "è", "ê", "ế", "ề",
+          "i", "í", "ì", "o", "ó", "ò", "ô", "ố", "ồ", "ơ", "ớ", "ờ", "u", "ú", "ù", "ư", "ứ", "ừ", "y", "ý"]
+CODAS = ["", "c", "ch", "m", "n", "ng", "nh", "p", "t", "i", "o", "u"]
+
+# ===================== CORPUS =====================
+
+def build_vocabulary(size, rng):
+    """Sinh các âm tiết giống tiếng Việt (phụ âm đầu + nguyên âm có dấu + âm cuối)"""
+    syllables = sorted({o + v + c for o in ONSETS for v in VOWELS for c in CODAS})
+    rng.shuffle(syllables)
+    return syllables[:size]
+
+def generate_corpus(path, n_docs, seed=0, vocab_size=10000, batch_size=10000):
+    """Tạo news_table tổng hợp với phân phối từ dạng Zipf"""
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    vocab = np.array(build_vocabulary(vocab_size, rng), dtype=object)
+    ranks = np.arange(1, len(vocab) + 1)
+    probs = 1.0 / ranks ** 1.07
+    probs /= probs.sum()
+    start = date(2023, 1, 1)
+
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    # Cùng schema với Database.migrations.SCHEMA (id là khóa chính, index theo ngày)
+    conn.execute("CREATE TABLE news_table (id TEXT PRIMARY KEY, title TEXT NOT NULL, content TEXT, date TEXT, source TEXT)")
+    conn.execute("CREATE INDEX idx_news_date ON news_table (date, id)")
+    for offset in range(0, n_docs, batch_size):
+        count = min(batch_size, n_docs - offset)
+        title_lens = np_rng.integers(8, 16, count)
+        content_lens = np_rng.integers(50, 150, count)
+        words = vocab[np_rng.choice(len(vocab), int(title_lens.sum() + content_lens.sum()), p=probs)]
+        rows = []
+        pos = 0
+        for i in range(count):
+            title = " ".join(words[pos:pos + title_lens[i]])
+            pos += title_lens[i]
+            content = " ".join(words[pos:pos + content_lens[i]])
+            pos += content_lens[i]
+            doc_id = offset + i
+            day = start + timedelta(days=int(np_rng.integers(0, 3 * 365)))
+            rows.append((
+                f"ID{doc_id:08d}", title, content, day.isoformat(),
+                f"{OUTLETS[doc_id % len(OUTLETS)]}/bai-viet-{doc_id}.html",
+            ))
+        conn.executemany("INSERT INTO news_table (id, title, content, date, source) VALUES (?, ?, ?, ?, ?)", rows)
+        conn.commit()
+    conn.close()
+
+def make_queries(db_path, n_queries, seed=0):
+    """Lấy ngẫu nhiên các bài báo, query là vài từ trong bài, bài đó là kết quả đúng"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    total = conn.execute("SELECT count(*) FROM news_table").fetchone()[0]
+    queries = []
+    for rowid in rng.sample(range(1, total + 1), min(n_queries, total)):
+        row = conn.execute("SELECT id, title, content FROM news_table WHERE rowid = ?", (rowid,)).fetchone()
+        if not row:
+            continue
+        words = f"{row[1]} {row[2]}".split()
+        if len(words) < 3:
+            continue
+        queries.append({"query": " ".join(rng.sample(words, min(len(words), rng.randint(3, 6)))), "target": row[0]})
+    conn.close()
+    return queries
+
+# ===================== WORKER =====================
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_worker(db_path, backend, queries, top_k, workdir):
+    """Chạy trong process con: build index của backend rồi chạy bộ query"""
+    os.environ["DB_PATH"] = db_path
+    os.environ["NEWS_VECTORDB_PATH"] = os.path.join(workdir, f"{os.path.basename(db_path)}.news.faiss")
+    os.environ["INVERTED_INDEX_PATH"] = os.path.join(workdir, f"{os.path.basename(db_path)}.inverted")
+    sys.path.insert(0, ROOT)
+    from Database import search_engine
+
+    mode = "hybrid" if backend == "hybrid" else "lexical"
+    search_backend = "memory" if backend in ("hybrid", "legacy") else backend
+    rss_before = peak_rss_mb()
+
+    started = time.perf_counter()
+    if backend == "legacy":
+        df = search_engine.load_data_from_db()
+        search_engine.build_bm25_index(df)
+    elif backend == "fts5":
+        # Corpus dùng chung giữa các backend nên FTS có thể đã được tạo; luôn rebuild để đo
+        search_engine.ensure_news_triggers()
+        with search_engine.engine.begin() as conn:
+            conn.execute(search_engine.text("INSERT INTO news_fts(news_fts) VALUES ('rebuild')"))
+    elif backend == "mmap":
+        search_engine.build_news_inverted_index()
+        search_engine.get_mmap_index()
+    else:
+        search_engine.get_bm25_index()
+    if mode == "hybrid":
+        search_engine.get_news_index(search_engine.engine)
+    build_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    search_engine.get_tfidf_model()
+    tfidf_build_s = time.perf_counter() - started
+
+    search_latencies, total_latencies, hits = [], [], 0
+    for item in queries:
+        started = time.perf_counter()
+        if backend == "legacy":
+            # Cách cũ: đọc lại toàn bộ bảng và build BM25Okapi cho mỗi query
+            df = search_engine.load_data_from_db()
+            bm25 = search_engine.build_bm25_index(df)
+            scores = bm25.get_scores(search_engine.simple_tokenize(search_engine.clean_text(item["query"])))
+            top = np.argsort(scores)[::-1][:top_k]
+            results = df.iloc[top][["id", "title", "content", "date", "source"]].to_dict(orient="records")
+        else:
+            results = search_engine.search_bm25(item["query"], top_k, backend=search_backend, mode=mode)
+        search_done = time.perf_counter()
+        search_engine.rerank_with_tfidf([dict(res) for res in results], item["query"])
+        finished = time.perf_counter()
+
+        search_latencies.append(search_done - started)
+        total_latencies.append(finished - started)
+        hits += any(res["id"] == item["target"] for res in results)
+
+    return {
+        "backend": backend,
+        "build_s": round(build_s, 4),
+        "tfidf_build_s": round(tfidf_build_s, 4),
+        "search_p50_ms": percentile_ms(search_latencies, 50),
+        "search_p99_ms": percentile_ms(search_latencies, 99),
+        "total_p50_ms": percentile_ms(total_latencies, 50),
+        "total_p99_ms": percentile_ms(total_latencies, 99),
+        f"recall@{top_k}": round(hits / len(queries), 4) if queries else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "index_rss_mb": round(peak_rss_mb() - rss_before, 1),
+        "queries": len(queries),
+    }
+
+# ===================== ORCHESTRATION =====================
+
+def available_backends():
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("DB_PATH", ":memory:")
+    from Database.search_engine import SEARCH_BACKENDS
+    return list(SEARCH_BACKENDS) + ["hybrid"]
+
+def run_case(corpus, db_path, backend, queries_path, top_k, workdir):
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", db_path, backend, queries_path,
+           "--top-k", str(top_k), "--workdir", workdir]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"corpus": corpus, "backend": backend, "error": proc.stderr.strip().splitlines()[-1:]}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["corpus"] = corpus
+    return result
+
+def compare(results, baseline_path):
+    """In tỉ lệ thay đổi so với một file kết quả cũ (>1 là chậm hơn/tốn hơn)"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["corpus"], r["backend"]): r for r in json.load(f)["results"]}
+    for result in results:
+        old = baseline.get((result["corpus"], result["backend"]))
+        if not old or "error" in result or "error" in old:
+            continue
+        ratios = {
+            key: round(result[key] / old[key], 2)
+            for key in ("build_s", "search_p50_ms", "search_p99_ms", "total_p99_ms", "peak_rss_mb")
+            if result.get(key) and old.get(key)
+        }
+        print(f"{result['corpus']:>12} {result['backend']:>8} {ratios}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search_bm25 + rerank_with_tfidf")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[10000, 100000, 1000000])
+    parser.add_argument("--db", help="Dùng database thật (ví dụ data/news_database.db) thay cho corpus tổng hợp")
+    parser.add_argument("--backends", nargs="*", help="Mặc định: tất cả backend của search_bm25 + hybrid")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    parser.add_argument("--output", help="File JSON kết quả (mặc định in ra stdout)")
+    parser.add_argument("--compare", help="File JSON kết quả cũ để so sánh")
+    parser.add_argument("--worker", nargs=3, metavar=("DB", "BACKEND", "QUERIES"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        db_path, backend, queries_path = args.worker
+        with open(queries_path, encoding="utf-8") as f:
+            queries = json.load(f)
+        print(json.dumps(run_worker(db_path, backend, queries, args.top_k, args.workdir)))
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    backends = args.backends or available_backends()
+    corpora = []
+    if args.db:
+        # Copy để các backend (trigger FTS5, ...) không ghi vào database thật
+        db_copy = os.path.join(args.workdir, "real.db")
+        with sqlite3.connect(args.db) as src, sqlite3.connect(db_copy) as dst:
+            src.backup(dst)
+        corpora.append((os.path.basename(args.db), db_copy))
+    else:
+        for size in args.sizes:
+            db_path = os.path.join(args.workdir, f"synthetic_{size}_{args.seed}.db")
+            if not os.path.exists(db_path):
+                print(f"Tạo corpus {size} bài...", file=sys.stderr)
+                generate_corpus(db_path, size, seed=args.seed)
+            corpora.append((f"synthetic_{size}", db_path))
+
+    results = []
+    for corpus, db_path in corpora:
+        queries_path = db_path + ".queries.json"
+        with open(queries_path, "w", encoding="utf-8") as f:
+            json.dump(make_queries(db_path, args.queries, args.seed), f, ensure_ascii=False)
+        for backend in backends:
+            print(f"[{corpus}] {backend}...", file=sys.stderr)
+            results.append(run_case(corpus, db_path, backend, queries_path, args.top_k, args.workdir))
+
+    write_report({**report_header(), "top_k": args.top_k, "results": results}, args.output)
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Thời gian `import app` và profile import theo package (python -X importtime).
+
+Ví dụ:
+    python Benchmark/bench_startup.py --output startup.json
+    python Benchmark/bench_startup.py --runs 5 --budget 4
+
+Mỗi lần đo chạy trong một process mới (không dùng lại module đã import). Báo cáo gồm thời
+gian import (median/max), các package tốn thời gian nhất (self time cộng theo package gốc),
+các module có cumulative time lớn nhất và các thư viện nặng đã bị import sớm.
+
+Script thoát với mã 1 nếu median vượt ngân sách (--budget, mặc định STARTUP_BUDGET_SECONDS
+hoặc DEFAULT_BUDGET_SECONDS; --budget 0 để chỉ đo) hoặc một thư viện nặng (chỉ nên load lúc
+warmup / dùng lần đầu) đã được import cùng app.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from common import ROOT, report_header, write_report
+
+# Ngân sách mặc định cho median thời gian import app (hiện khoảng 2.7s trên máy dev)
+DEFAULT_BUDGET_SECONDS = 4.0
+
+# Chỉ được load khi dùng lần đầu hoặc trong warmup, không phải lúc import app
+HEAVY_MODULES = [
+    "faiss", "sentence_transformers", "torch", "transformers", "sklearn", "scipy", "rank_bm25",
+    "crewai", "langchain_openai", "openai", "googleapiclient", "whois", "tldextract", "bs4",
+    "dateparser", "onnxruntime", "httpx",
+]
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app
+seconds = time.perf_counter() - start
+heavy = sorted(name for name in %r if name in sys.modules)
+print(json.dumps({"seconds": seconds, "modules": len(sys.modules), "heavy": heavy}))
+""" % (HEAVY_MODULES,)
+
+def child_env():
+    env = dict(os.environ)
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+def measure_import():
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=ROOT, env=child_env(),
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us)] từ output của -X importtime"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+def profile_imports(top):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=child_env(),
+        capture_output=True, text=True, check=True,
+    )
+    modules = parse_importtime(result.stderr)
+    by_package = defaultdict(int)
+    for name, self_us, _ in modules:
+        by_package[name.split(".")[0]] += self_us
+    packages = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    slowest = sorted(modules, key=lambda item: item[2], reverse=True)[:top]
+    return {
+        "modules": len(modules),
+        "packages": [{"package": name, "self_ms": round(us / 1000, 1)} for name, us in packages],
+        "cumulative": [{"module": name, "cumulative_ms": round(us / 1000, 1)} for name, _, us in slowest],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Thời gian import app và profile import")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=20, help="Số package/module hiển thị trong profile")
+    parser.add_argument("--budget", type=float,
+                        default=float(os.getenv("STARTUP_BUDGET_SECONDS", str(DEFAULT_BUDGET_SECONDS))),
+                        help="Ngân sách (giây) cho median thời gian import app, 0 để không kiểm tra")
+    parser.add_argument("--output", help="File JSON kết quả (mặc định in ra stdout)")
+    args = parser.parse_args()
+
+    runs = [measure_import() for _ in range(args.runs)]
+    seconds = [run["seconds"] for run in runs]
+    heavy = sorted({name for run in runs for name in run["heavy"]})
+    report = {
+        **report_header(),
+        "runs": args.runs,
+        "import_seconds_median": round(statistics.median(seconds), 3),
+        "import_seconds_max": round(max(seconds), 3),
+        "modules_loaded": runs[-1]["modules"],
+        "heavy_modules_loaded": heavy,
+        "budget_seconds": args.budget or None,
+        "profile": profile_imports(args.top),
+    }
+    failures = []
+    if args.budget and report["import_seconds_median"] > args.budget:
+        failures.append(f"import app mất {report['import_seconds_median']}s, vượt ngân sách {args.budget}s")
+    if heavy:
+        failures.append(f"các thư viện nặng bị import cùng app: {', '.join(heavy)}")
+    report["passed"] = not failures
+
+    write_report(report, args.output)
+    for failure in failures:
+        print(f"[X] {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Các hàm dùng chung cho các script benchmark: thông tin môi trường và ghi báo cáo JSON"""
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def percentile_ms(values, q):
+    """Phân vị q (giây -> mili giây) của các giá trị đo, None nếu không có giá trị"""
+    return round(float(np.percentile(values, q)) * 1000, 3) if values else None
+
+def report_header():
+    """Các trường chung đầu báo cáo để so sánh kết quả giữa các commit/máy"""
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+    }
+
+def write_report(report, output=None):
+    """Ghi báo cáo JSON ra file output, hoặc in ra stdout nếu không có"""
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
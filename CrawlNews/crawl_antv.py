@@ -1,12 +1,11 @@
-import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
 import re
+from CrawlNews.engine import Source, run_crawl
 
-def get_article_content_antv(link):
+def parse_article(html, item=None):
     """Lấy nội dung chi tiết bài viết trên ANTV trong div.detail-article"""
-    response = requests.get(link)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(html, 'html.parser')
 
     content = ""
     detail_div = soup.find("div", class_="detail-article")
@@ -16,13 +15,12 @@ def get_article_content_antv(link):
             if text and "ANTV" not in text and "VTVGo" not in text and "TV Online" not in text:
                 content += text + "\n"
 
-    return content.strip()
+    return {"content": content.strip()}
 
-def crawl_antv(url="https://antv.gov.vn/su-kien/tham-hoa-hang-khong-62.html"):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+def parse_listing(html, url=None):
+    soup = BeautifulSoup(html, 'html.parser')
 
-    articles = []
+    items = []
 
     for item in soup.select("article.article-horizontal"):
         title_tag = item.select_one("h2 a.title-link")
@@ -44,22 +42,19 @@ def crawl_antv(url="https://antv.gov.vn/su-kien/tham-hoa-hang-khong-62.html"):
         except:
             article_date = None
 
-        try:
-            content = get_article_content_antv(detail_link)
-        except Exception as e:
-            print(f"❌ Lỗi khi lấy nội dung bài viết: {detail_link}, Error: {e}")
-            content = ""
-
-        articles.append({
+        items.append({
             "title": title,
             "link": detail_link,
             "sapo": sapo,
-            "content": content,
             "date": article_date,
         })
 
-    return articles
+    return items
 
+SOURCE = Source("antv", "https://antv.gov.vn/su-kien/tham-hoa-hang-khong-62.html", parse_listing, parse_article)
+
+def crawl_antv(url="https://antv.gov.vn/su-kien/tham-hoa-hang-khong-62.html"):
+    return run_crawl(SOURCE, url)
 
 # def main():
 #     articles = crawl_antv()
@@ -1,11 +1,10 @@
-import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
+from CrawlNews.engine import Source, run_crawl
 
-def get_article_content_cafef(detail_url):
+def parse_article(html, item=None):
     """Lấy nội dung chi tiết bài viết từ cafef.vn"""
-    response = requests.get(detail_url)
-    soup = BeautifulSoup(response.content, "html.parser")
+    soup = BeautifulSoup(html, "html.parser")
 
     content_div = soup.find("div", class_="detail-content afcbc-body")
     content = ""
@@ -14,14 +13,13 @@ def get_article_content_cafef(detail_url):
             text = p.get_text(strip=True)
             if text:
                 content += text + "\n"
-    return content.strip()
+    return {"content": content.strip()}
 
 
-def crawl_cafef(url="https://cafef.vn/thi-truong-chung-khoan.chn"):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, "html.parser")
+def parse_listing(html, url=None):
+    soup = BeautifulSoup(html, "html.parser")
 
-    articles = []
+    items = []
     for item in soup.select("div.tlitem-flex"):
         a_tag = item.find("a", class_="avatar")
         title = a_tag.get("title", "").strip() if a_tag else "Không có tiêu đề"
@@ -43,21 +41,19 @@ def crawl_cafef(url="https://cafef.vn/thi-truong-chung-khoan.chn"):
         sapo_tag = item.select_one("p.sapo")
         sapo = sapo_tag.get_text(strip=True) if sapo_tag else ""
 
-        try:
-            content = get_article_content_cafef(link)
-        except Exception as e:
-            print(f"❌ Lỗi lấy nội dung từ {link}: {e}")
-            content = ""
-
-        articles.append({
+        items.append({
             "title": title,
             "link": link,
             "sapo": sapo,
-            "content": content,
             "date": article_date,
         })
 
-    return articles
+    return items
+
+SOURCE = Source("cafef", "https://cafef.vn/thi-truong-chung-khoan.chn", parse_listing, parse_article)
+
+def crawl_cafef(url="https://cafef.vn/thi-truong-chung-khoan.chn"):
+    return run_crawl(SOURCE, url)
 
 # def main():
 #     articles = crawl_cafef()
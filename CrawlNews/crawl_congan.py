@@ -1,12 +1,11 @@
-import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
 import re
+from CrawlNews.engine import Source, run_crawl
 
-def get_article_content(url):
+def parse_article(html, item=None):
     """Lấy nội dung và ngày đăng từ một bài viết trên Báo Công An"""
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(html, 'html.parser')
 
     # Lấy nội dung bài viết
     content = ''
@@ -28,14 +27,13 @@ def get_article_content(url):
     else:
         article_datetime = None
 
-    return content.strip(), article_datetime
+    return {'content': content.strip(), 'date': article_datetime}
 
-def crawl_congan(url='https://congan.com.vn/tin-chinh'):
-    """Thu thập danh sách bài viết từ chuyên mục Tin Chính của Báo Công An"""
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+def parse_listing(html, url=None):
+    """Danh sách bài viết trên chuyên mục Tin Chính của Báo Công An"""
+    soup = BeautifulSoup(html, 'html.parser')
 
-    articles = []
+    items = []
     for item in soup.find_all('li'):
         # Lấy tiêu đề bài viết
         title_tag = item.find('h3')
@@ -43,22 +41,20 @@ def crawl_congan(url='https://congan.com.vn/tin-chinh'):
             link_tag = title_tag.find('a')
             title = link_tag.text.strip() if link_tag else "Không có tiêu đề"
             link = link_tag['href'] if link_tag else None
-            
+
             # Xử lý link
             if link and not link.startswith('http'):
                 link = 'https://congan.com.vn' + link
-            
-            # Lấy nội dung bài viết từ trang chi tiết
-            content, article_date = get_article_content(link) if link else ('', None)
 
-            articles.append({
-                'title': title,
-                'link': link,
-                'content': content,
-                'date': article_date,  
-            })
-    
-    return articles
+            items.append({'title': title, 'link': link})
+
+    return items
+
+SOURCE = Source('congan', 'https://congan.com.vn/tin-chinh', parse_listing, parse_article)
+
+def crawl_congan(url='https://congan.com.vn/tin-chinh'):
+    """Thu thập danh sách bài viết từ chuyên mục Tin Chính của Báo Công An"""
+    return run_crawl(SOURCE, url)
 
 # def main():
 #     articles = crawl_congan()
@@ -1,11 +1,10 @@
-import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
+from CrawlNews.engine import Source, run_crawl
 
-def get_article_content(url):
+def parse_article(html, item=None):
     """Lấy nội dung và ngày đăng từ một bài viết trên Dân Trí"""
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(html, 'html.parser')
 
     # Lấy nội dung bài viết
     content = ''
@@ -21,37 +20,38 @@ def get_article_content(url):
     else:
         article_date = None
 
-    return content.strip(), article_date
+    return {'content': content.strip(), 'date': article_date}
 
-def crawl_dantri(url='https://dantri.com.vn/tin-moi-nhat.htm'):
-    """Thu thập danh sách bài viết từ chuyên mục mới nhất của Dân Trí"""
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+def parse_listing(html, url=None):
+    """Danh sách bài viết trên chuyên mục mới nhất của Dân Trí"""
+    soup = BeautifulSoup(html, 'html.parser')
 
-    articles = []
+    items = []
     for item in soup.find_all('article', class_='article-list'):
         # Lấy tiêu đề bài viết
         title_tag = item.find('h3', class_='article-title')
         if title_tag:
             title = title_tag.text.strip()
-            
+
             # Lấy link bài viết
             link_tag = title_tag.find('a')
             link = link_tag['href'] if link_tag else None
             if link and not link.startswith('http'):
                 link = 'https://dantri.com.vn' + link
-        
-            # Lấy nội dung bài viết từ trang chi tiết
-            content, article_date = get_article_content(link) if link else ('', None)
 
-            articles.append({
-                'title': title,
-                'link': link,
-                'content': content,
-                'date': article_date,  
-            })
-    
-    return articles
+            items.append({'title': title, 'link': link})
+
+    return items
+
+def page_url(listing_url, page):
+    """Trang thứ page của chuyên mục: https://dantri.com.vn/tin-moi-nhat/trang-2.htm"""
+    return f"{listing_url[:-len('.htm')] if listing_url.endswith('.htm') else listing_url}/trang-{page}.htm"
+
+SOURCE = Source('dantri', 'https://dantri.com.vn/tin-moi-nhat.htm', parse_listing, parse_article, page_url)
+
+def crawl_dantri(url='https://dantri.com.vn/tin-moi-nhat.htm'):
+    """Thu thập danh sách bài viết từ chuyên mục mới nhất của Dân Trí"""
+    return run_crawl(SOURCE, url)
 
 # def main():
 #     articles = crawl_dantri()
@@ -1,11 +1,10 @@
-import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
+from CrawlNews.engine import Source, run_crawl
 
-def get_article_content(url):
+def parse_article(html, item=None):
     """Lấy nội dung và ngày đăng từ một bài viết trên Nhân Dân"""
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(html, 'html.parser')
 
     # Lấy nội dung bài viết
     content = ''
@@ -21,13 +20,12 @@ def get_article_content(url):
     else:
         article_date = None
 
-    return content.strip(), article_date
+    return {'content': content.strip(), 'date': article_date}
 
-def crawl_nhandan(url='https://nhandan.vn/tin-moi.html'):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+def parse_listing(html, url=None):
+    soup = BeautifulSoup(html, 'html.parser')
 
-    articles = []
+    items = []
     for item in soup.find_all('article', class_='story'):
         # Lấy tiêu đề bài viết
         title_tag = item.find('h3', class_='story__heading')
@@ -35,22 +33,19 @@ def crawl_nhandan(url='https://nhandan.vn/tin-moi.html'):
             link_tag = title_tag.find('a', class_='cms-link')
             title = title_tag.text.strip() if title_tag else "Không có tiêu đề"
             link = link_tag['href'] if link_tag else None
-            
+
             # Xử lý link
             if link and not link.startswith('http'):
                 link = 'https://nhandan.vn' + link
 
-            # Lấy nội dung bài viết từ trang chi tiết
-            content, article_date = get_article_content(link) if link else ('', None)
+            items.append({'title': title, 'link': link})
+
+    return items
 
-            articles.append({
-                'title': title,
-                'link': link,
-                'content': content,
-                'date': article_date,
-            })
-    
-    return articles
+SOURCE = Source('nhandan', 'https://nhandan.vn/tin-moi.html', parse_listing, parse_article)
+
+def crawl_nhandan(url='https://nhandan.vn/tin-moi.html'):
+    return run_crawl(SOURCE, url)
 
 # def main():
 #     articles = crawl_nhandan()
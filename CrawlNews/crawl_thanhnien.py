@@ -1,12 +1,11 @@
-import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
 import dateparser
+from CrawlNews.engine import Source, run_crawl
 
-def get_article_content_tn(url):
+def parse_article(html, item=None):
     """Lấy nội dung và ngày đăng từ một bài viết trên Thanh Niên"""
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(html, 'html.parser')
 
     # Lấy nội dung bài viết
     content = ''
@@ -22,13 +21,12 @@ def get_article_content_tn(url):
     else:
         article_date = None
 
-    return content.strip(), article_date
+    return {'content': content.strip(), 'date': article_date}
 
-def crawl_thanhnien(url='https://thanhnien.vn/chinh-tri.htm'):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+def parse_listing(html, url=None):
+    soup = BeautifulSoup(html, 'html.parser')
 
-    articles = []
+    items = []
     for item in soup.find_all('div', class_='box-category-item'):
         title_tag = item.find('h3', class_='box-title-text')
         if title_tag:
@@ -39,17 +37,14 @@ def crawl_thanhnien(url='https://thanhnien.vn/chinh-tri.htm'):
                 if not link.startswith('http'):
                     link = 'https://thanhnien.vn' + link
 
-                # Lấy nội dung và ngày đăng của bài viết
-                content, date = get_article_content_tn(link)
-
-                articles.append({
-                    'title': title,
-                    'link': link,
-                    'content': content,
-                    'date': date
-                })
-    
-    return articles
+                items.append({'title': title, 'link': link})
+
+    return items
+
+SOURCE = Source('thanhnien', 'https://thanhnien.vn/chinh-tri.htm', parse_listing, parse_article)
+
+def crawl_thanhnien(url='https://thanhnien.vn/chinh-tri.htm'):
+    return run_crawl(SOURCE, url)
 
 # def main():
 #     articles = crawl_thanhnien()
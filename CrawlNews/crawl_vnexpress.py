@@ -1,11 +1,10 @@
-import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
 import dateparser
+from CrawlNews.engine import Source, run_crawl
 
-def get_article_content(url):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+def parse_article(html, item=None):
+    soup = BeautifulSoup(html, 'html.parser')
     paragraphs = [p.text.strip() for p in soup.find_all('p') if p.text.strip()]
     content = "\n".join(dict.fromkeys(paragraphs))
 
@@ -18,25 +17,32 @@ def get_article_content(url):
     else:
         article_date = None
 
-    return content.strip(), article_date
+    return {'content': content.strip(), 'date': article_date}
 
-def crawl_vnexpress(url='https://vnexpress.net/thoi-su'):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+def parse_listing(html, url=None):
+    soup = BeautifulSoup(html, 'html.parser')
 
-    articles = []
+    items = []
     for item in soup.find_all('article'):
         title_tag = item.find('h3')
         summary_tag = item.find('p')
-        if title_tag and summary_tag:
+        if title_tag and summary_tag and title_tag.find('a'):
             title = title_tag.text.strip()
             link = title_tag.find('a')['href']
             if not link.startswith('http'):
                 link = 'https://vnexpress.net' + link
-            content, date = get_article_content(link)
-            articles.append({'title': title, 'link': link, 'content': content, 'date': date})
-    
-    return articles
+            items.append({'title': title, 'link': link})
+
+    return items
+
+def page_url(listing_url, page):
+    """Trang thứ page của chuyên mục: https://vnexpress.net/thoi-su-p2"""
+    return f"{listing_url.rstrip('/')}-p{page}"
+
+SOURCE = Source('vnexpress', 'https://vnexpress.net/thoi-su', parse_listing, parse_article, page_url)
+
+def crawl_vnexpress(url='https://vnexpress.net/thoi-su'):
+    return run_crawl(SOURCE, url)
 
 # def main():
 #     vnexpress_articles = crawl_vnexpress()
@@ -1,12 +1,11 @@
-import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
 import re
+from CrawlNews.engine import Source, run_crawl
 
-def get_article_content_vtv(url):
+def parse_article(html, item=None):
     """Lấy tiêu đề, ngày đăng, mô tả và nội dung bài viết trên VTV.vn"""
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(html, 'html.parser')
 
     # Tiêu đề
     title_tag = soup.select_one("h1.title_detail")
@@ -43,15 +42,14 @@ def get_article_content_vtv(url):
                 article_date = None
 
     full_content = f"{description}\n\n{content}".strip()
-    return title, full_content, article_date
+    return {"title": title, "content": full_content, "date": article_date}
 
 
-def crawl_vtv(url="https://vtv.vn/canh-bao-lua-dao.html"):
-    """Crawl các bài viết từ trang VTV mục cảnh báo lừa đảo"""
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, "html.parser")
+def parse_listing(html, url=None):
+    """Các link bài viết trên trang VTV mục cảnh báo lừa đảo (tiêu đề lấy từ trang chi tiết)"""
+    soup = BeautifulSoup(html, "html.parser")
 
-    articles = []
+    items = []
     for a_tag in soup.select("div.tinmoi_st.timeline a[data-linktype='newsdetail']"):
         link = a_tag.get("href")
         if not link:
@@ -60,18 +58,15 @@ def crawl_vtv(url="https://vtv.vn/canh-bao-lua-dao.html"):
         if not link.startswith("http"):
             link = "https://vtv.vn" + link
 
-        try:
-            title, content, article_date = get_article_content_vtv(link)
-            articles.append({
-                "title": title,
-                "link": link,
-                "content": content,
-                "date": article_date,
-            })
-        except Exception as e:
-            print(f"❌ Lỗi khi crawl bài viết: {link}, Error: {e}")
-
-    return articles
+        items.append({"link": link})
+
+    return items
+
+SOURCE = Source("vtv", "https://vtv.vn/canh-bao-lua-dao.html", parse_listing, parse_article)
+
+def crawl_vtv(url="https://vtv.vn/canh-bao-lua-dao.html"):
+    """Crawl các bài viết từ trang VTV mục cảnh báo lừa đảo"""
+    return run_crawl(SOURCE, url)
 
 # def main():
 #     articles = crawl_vtv()
@@ -0,0 +1,187 @@
+import os
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Callable, Optional
+from urllib.parse import urlparse
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Số request đồng thời tối đa trên tất cả các nguồn
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "16"))
+# Số request đồng thời tối đa tới cùng một host
+CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST", "4"))
+# Khoảng cách tối thiểu (giây) giữa hai lần bắt đầu request tới cùng một host
+CRAWL_HOST_DELAY = float(os.getenv("CRAWL_HOST_DELAY", "0.2"))
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "15"))
+CRAWL_RETRIES = int(os.getenv("CRAWL_RETRIES", "2"))
+# Số trang danh sách tối đa mỗi lần crawl (chỉ với nguồn có page_url)
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "3"))
+# Dừng sang trang kế tiếp khi một trang danh sách chỉ còn bài đã crawl
+CRAWL_STOP_EARLY = os.getenv("CRAWL_STOP_EARLY", "1") != "0"
+CRAWL_USER_AGENT = os.getenv(
+    "CRAWL_USER_AGENT",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36"
+)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+@dataclass
+class Source:
+    """Một nguồn báo: trang danh sách và hai hàm parse riêng của trang đó.
+
+    parse_listing(html, url) trả về các bài trên trang danh sách (dict có "link", có thể
+    kèm title, date, sapo...). parse_article(html, item) trả về các trường lấy từ trang
+    chi tiết (content, date...), được gộp đè lên item. page_url(listing_url, page) trả về URL
+    trang danh sách thứ page (từ 2), chỉ có với nguồn biết cách phân trang.
+    """
+    name: str
+    listing_url: str
+    parse_listing: Callable
+    parse_article: Callable
+    page_url: Optional[Callable] = None
+
+class HostLimiter:
+    """Giới hạn số request đồng thời và nhịp gửi request tới một host"""
+
+    def __init__(self, concurrency=CRAWL_PER_HOST, delay=CRAWL_HOST_DELAY):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.delay = delay
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait_turn(self):
+        async with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+class CrawlEngine:
+    """HTTP client dùng chung (pool kết nối, timeout, retry) cho mọi nguồn trong một lần crawl.
+
+    Dùng trong một event loop:
+        async with CrawlEngine() as engine:
+            articles = await crawl_source(engine, source)
+    """
+
+    def __init__(self, concurrency=CRAWL_CONCURRENCY, per_host=CRAWL_PER_HOST, host_delay=CRAWL_HOST_DELAY,
+                 timeout=CRAWL_TIMEOUT, retries=CRAWL_RETRIES, transport=None):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.per_host = per_host
+        self.host_delay = host_delay
+        self.retries = retries
+        self.hosts = {}
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            follow_redirects=True,
+            headers={"User-Agent": CRAWL_USER_AGENT},
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            transport=transport,
+        )
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    def host_limiter(self, url):
+        host = urlparse(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = HostLimiter(self.per_host, self.host_delay)
+        return self.hosts[host]
+
+    async def fetch(self, url):
+        """Nội dung (bytes) của url; thử lại khi lỗi mạng hoặc 429/5xx.
+
+        Chờ lượt của host trước rồi mới giữ slot chung, chỉ trong lúc gửi request, nên một host
+        chậm không chiếm hết slot của các host khác; lúc chờ retry không giữ slot nào.
+        """
+        limiter = self.host_limiter(url)
+        for attempt in range(self.retries + 1):
+            async with limiter.semaphore:
+                await limiter.wait_turn()
+                self.requests += 1
+                try:
+                    async with self.semaphore:
+                        response = await self.client.get(url)
+                    if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                        response.raise_for_status()
+                        self.bytes += len(response.content)
+                        return response.content
+                except httpx.TransportError:
+                    if attempt == self.retries:
+                        self.errors += 1
+                        raise
+                except httpx.HTTPStatusError:
+                    self.errors += 1
+                    raise
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+    def stats(self):
+        return {"requests": self.requests, "errors": self.errors, "bytes": self.bytes, "hosts": len(self.hosts)}
+
+async def crawl_listing(engine, source, url=None, state=None, max_pages=1, stop_early=CRAWL_STOP_EARLY):
+    """Các bài trên trang danh sách (và các trang kế tiếp nếu nguồn có page_url) cần lấy trang chi tiết.
+
+    state (ví dụ Database.crawl_state) có known_links(links) và touch_links(links): bài đã crawl
+    bị bỏ qua trước khi tải trang chi tiết; với stop_early, gặp trang chỉ còn bài đã biết thì dừng.
+    """
+    base_url = url = url or source.listing_url
+    items = {}
+    for page in range(1, max(max_pages, 1) + 1):
+        if page > 1:
+            if source.page_url is None:
+                break
+            url = source.page_url(base_url, page)
+        html = await engine.fetch(url)
+        page_items = await asyncio.to_thread(source.parse_listing, html, url)
+        # Một bài có thể xuất hiện nhiều lần trên trang danh sách
+        page_items = {item["link"]: item for item in page_items if item.get("link")}
+        if not page_items:
+            break
+        known = set()
+        if state is not None:
+            known = await asyncio.to_thread(state.known_links, list(page_items))
+            if known:
+                await asyncio.to_thread(state.touch_links, list(known))
+        new_items = {link: item for link, item in page_items.items() if link not in known and link not in items}
+        items.update(new_items)
+        if stop_early and state is not None and not new_items:
+            break
+    return list(items.values())
+
+async def crawl_source(engine, source, url=None, state=None, max_pages=1, stop_early=CRAWL_STOP_EARLY):
+    """Crawl trang danh sách của source rồi lấy song song các trang chi tiết.
+
+    Bài lỗi khi lấy/parse trang chi tiết bị bỏ qua (lần crawl sau sẽ thử lại).
+    """
+    items = await crawl_listing(engine, source, url, state, max_pages, stop_early)
+
+    async def fetch_article(item):
+        try:
+            html = await engine.fetch(item["link"])
+            fields = await asyncio.to_thread(source.parse_article, html, item)
+        except Exception as e:
+            print(f"❌ Lỗi khi lấy nội dung bài viết: {item['link']}, Error: {e}")
+            return None
+        if fields is None:
+            return None
+        article = {"title": None, "content": "", "date": None, **item, **fields}
+        return article if article["title"] else None
+
+    articles = await asyncio.gather(*(fetch_article(item) for item in items))
+    return [article for article in articles if article is not None]
+
+def run_crawl(source, url=None):
+    """Bản đồng bộ của crawl_source cho một nguồn (không gọi từ trong event loop đang chạy)"""
+    async def run():
+        async with CrawlEngine() as engine:
+            return await crawl_source(engine, source, url)
+    return asyncio.run(run())
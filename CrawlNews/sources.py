@@ -0,0 +1,49 @@
+import asyncio
+import importlib
+from CrawlNews.engine import CrawlEngine, crawl_source, CRAWL_MAX_PAGES, CRAWL_STOP_EARLY
+
+# Tên nguồn -> (tên miền, module trong CrawlNews). Module chỉ được import khi crawl nguồn đó.
+SOURCES = {
+    "dantri": ("dantri.com.vn", "crawl_dantri"),
+    "vnexpress": ("vnexpress.net", "crawl_vnexpress"),
+    "congan": ("congan.com.vn", "crawl_congan"),
+    "nhandan": ("nhandan.vn", "crawl_nhandan"),
+    "thanhnien": ("thanhnien.vn", "crawl_thanhnien"),
+    "cafef": ("cafef.vn", "crawl_cafef"),
+    "antv": ("antv.gov.vn", "crawl_antv"),
+    "vtv": ("vtv.vn", "crawl_vtv"),
+}
+
+def get_source(name):
+    """Source (trang danh sách + hàm parse) của một nguồn trong SOURCES"""
+    if name not in SOURCES:
+        raise ValueError(f"Nguồn không hợp lệ: {name}. Chọn một trong {tuple(SOURCES)}")
+    return importlib.import_module(f"CrawlNews.{SOURCES[name][1]}").SOURCE
+
+def source_for_url(url):
+    """Tên nguồn ứng với một URL (theo tên miền), None nếu không hỗ trợ"""
+    return next((name for name, (domain, _) in SOURCES.items() if domain in url), None)
+
+async def crawl_sources(names, incremental=True, max_pages=None, stop_early=None):
+    """Crawl đồng thời nhiều nguồn với một CrawlEngine dùng chung.
+
+    incremental=True: bỏ qua bài đã crawl/đã lưu (crawl_state, news_table) trước khi tải trang
+    chi tiết. Sau khi lưu bài, gọi Database.crawl_state.record_crawled để ghi nhận.
+    Trả về {tên nguồn: danh sách bài} hoặc {tên nguồn: Exception} nếu nguồn đó lỗi.
+    """
+    max_pages = CRAWL_MAX_PAGES if max_pages is None else max_pages
+    stop_early = CRAWL_STOP_EARLY if stop_early is None else stop_early
+    state = None
+    if incremental:
+        from Database import crawl_state as state
+    names = list(dict.fromkeys(names))
+    async with CrawlEngine() as engine:
+        results = await asyncio.gather(
+            *(crawl_source(engine, get_source(name), state=state, max_pages=max_pages, stop_early=stop_early) for name in names),
+            return_exceptions=True
+        )
+    return dict(zip(names, results))
+
+def crawl(names, incremental=True, max_pages=None, stop_early=None):
+    """Bản đồng bộ của crawl_sources (không gọi từ trong event loop đang chạy)"""
+    return asyncio.run(crawl_sources(names, incremental, max_pages, stop_early))
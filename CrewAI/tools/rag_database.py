@@ -4,11 +4,9 @@ from sqlalchemy import create_engine
 from dotenv import load_dotenv
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from Database.search_engine import search_bm25, rerank_with_tfidf
+from Database.search_engine import retrieve_news
 
 load_dotenv()
 
-def rag_db(query):
-    bm25_results = search_bm25(query)
-    final_results = rerank_with_tfidf(bm25_results, query)
-    return final_results
+def rag_db(query, mode=None):
+    return retrieve_news(query, mode=mode)
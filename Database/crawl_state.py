@@ -0,0 +1,62 @@
+import hashlib
+from datetime import datetime
+from sqlalchemy import text
+from Database.storage import engine, run_write, chunked, in_params
+
+def content_hash(content):
+    return hashlib.blake2b((content or "").encode("utf-8"), digest_size=16).hexdigest()
+
+def now_str():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def known_links(links):
+    """Các link đã crawl (crawl_state) hoặc đã có trong news_table (cột source), tra theo khóa/UNIQUE index"""
+    links = list(dict.fromkeys(link for link in links if link))
+    found = set()
+    with engine.connect() as conn:
+        for chunk in chunked(links):
+            params, placeholders = in_params(chunk)
+            found.update(row[0] for row in conn.execute(text(
+                f"SELECT link FROM crawl_state WHERE link IN ({placeholders}) "
+                f"UNION SELECT source FROM news_table WHERE source IN ({placeholders})"
+            ), params))
+    return found
+
+def touch_links(links):
+    """Cập nhật last_seen cho các link vẫn còn xuất hiện trên trang danh sách"""
+    links = list(dict.fromkeys(links))
+    if not links:
+        return
+
+    def write(conn):
+        seen = now_str()
+        for chunk in chunked(links):
+            params, placeholders = in_params(chunk)
+            params["seen"] = seen
+            conn.execute(text(f"UPDATE crawl_state SET last_seen = :seen WHERE link IN ({placeholders})"), params)
+    run_write(write)
+
+def record_crawled(source, articles):
+    """Ghi các bài đã lấy trang chi tiết (gọi sau khi đã lưu bài, để bài chưa lưu được crawl lại)"""
+    rows = [
+        {"link": article["link"], "source": source, "hash": content_hash(article.get("content"))}
+        for article in articles if article.get("link")
+    ]
+    if not rows:
+        return
+
+    def write(conn):
+        seen = now_str()
+        conn.execute(text(
+            "INSERT INTO crawl_state (link, source, first_seen, last_seen, content_hash) "
+            "VALUES (:link, :source, :seen, :seen, :hash) "
+            "ON CONFLICT(link) DO UPDATE SET last_seen = excluded.last_seen, content_hash = excluded.content_hash"
+        ), [{**row, "seen": seen} for row in rows])
+    run_write(write)
+
+def crawl_state_stats():
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT source, COUNT(*) AS links, MAX(last_seen) AS last_seen FROM crawl_state GROUP BY source"
+        )).mappings().all()
+    return {row["source"]: {"links": row["links"], "last_seen": row["last_seen"]} for row in rows}
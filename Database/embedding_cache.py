@@ -0,0 +1,213 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from contextlib import contextmanager
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khóa trong process
+    fcntl = None
+
+load_dotenv()
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache")
+# Số vector tối đa mỗi model, 0 để tắt cache
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "200000"))
+# Khi đầy, xóa thêm phần này của cache (LRU) để không phải evict ở mỗi lần ghi
+EVICT_RATIO = 0.05
+
+def normalize_text(text):
+    """Chuẩn hóa Unicode (NFC) và khoảng trắng để các bản sao của cùng một văn bản dùng chung key"""
+    return unicodedata.normalize("NFC", " ".join(str(text).split()))
+
+def text_key(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+class EmbeddingCache:
+    """Cache embedding trên đĩa cho một model: key = hash của văn bản đã chuẩn hóa.
+
+    Vector lưu trong một ma trận float16 (memmap, mỗi key một slot cố định), vị trí slot
+    và thời điểm dùng gần nhất lưu trong SQLite. Khi đầy thì slot ít dùng nhất bị thu hồi.
+    Các worker dùng chung file; thao tác trên cache được khóa bằng flock.
+    """
+
+    def __init__(self, model_name, path=EMBEDDING_CACHE_PATH, capacity=EMBEDDING_CACHE_SIZE):
+        self.model_name = model_name
+        self.capacity = capacity
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        os.makedirs(path, exist_ok=True)
+        self.base = os.path.join(path, slug)
+        self.db = sqlite3.connect(f"{self.base}.sqlite", timeout=30, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS embedding (
+                key TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_embedding_last_used ON embedding (last_used);
+            CREATE TABLE IF NOT EXISTS free_slot (slot INTEGER PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self.lock_file = open(f"{self.base}.lock", "a")
+        self.lock = threading.Lock()
+        self.matrix = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @contextmanager
+    def locked(self, exclusive):
+        with self.lock:
+            if fcntl is not None:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _open_matrix(self, dim=None):
+        """Mở ma trận vector; tạo file (sparse) lần đầu khi đã biết số chiều"""
+        if self.matrix is not None:
+            return self.matrix
+        stored_dim = self._meta("dim")
+        if stored_dim is None:
+            if dim is None:
+                return None
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (str(dim),))
+            self.db.commit()
+            stored_dim = dim
+        stored_dim = int(stored_dim)
+        capacity = int(self._meta("capacity") or self.capacity)
+        if self._meta("capacity") is None:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('capacity', ?)", (str(capacity),))
+            self.db.commit()
+        self.capacity = capacity
+        matrix_path = f"{self.base}.f16"
+        if not os.path.exists(matrix_path):
+            with open(matrix_path, "wb") as f:
+                f.truncate(capacity * stored_dim * 2)
+        self.matrix = np.memmap(matrix_path, dtype=np.float16, mode="r+", shape=(capacity, stored_dim))
+        return self.matrix
+
+    def get_many(self, keys):
+        """{key: vector float32} cho các key đã có trong cache"""
+        found = {}
+        if not keys:
+            return found
+        with self.locked(exclusive=False):
+            matrix = self._open_matrix()
+            if matrix is None:
+                self.misses += len(keys)
+                return found
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                rows = self.db.execute(
+                    f"SELECT key, slot FROM embedding WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, slot in rows:
+                    found[key] = np.asarray(matrix[slot], dtype=np.float32)
+        if found:
+            # Cập nhật thời điểm dùng cho LRU (chỉ ảnh hưởng thứ tự evict)
+            with self.locked(exclusive=True):
+                now = time.time()
+                self.db.executemany("UPDATE embedding SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                self.db.commit()
+        self.hits += sum(1 for key in keys if key in found)
+        self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def _allocate(self, n):
+        slots = [row[0] for row in self.db.execute("SELECT slot FROM free_slot ORDER BY slot LIMIT ?", (n,))]
+        if slots:
+            self.db.executemany("DELETE FROM free_slot WHERE slot = ?", [(slot,) for slot in slots])
+        next_slot = int(self._meta("next_slot") or 0)
+        fresh = min(n - len(slots), self.capacity - next_slot)
+        if fresh > 0:
+            slots.extend(range(next_slot, next_slot + fresh))
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('next_slot', ?)", (str(next_slot + fresh),))
+        short = n - len(slots)
+        if short > 0:
+            evict = short + int(self.capacity * EVICT_RATIO)
+            victims = self.db.execute("SELECT key, slot FROM embedding ORDER BY last_used LIMIT ?", (evict,)).fetchall()
+            self.db.executemany("DELETE FROM embedding WHERE key = ?", [(key,) for key, _ in victims])
+            freed = [slot for _, slot in victims]
+            slots.extend(freed[:short])
+            self.db.executemany("INSERT OR IGNORE INTO free_slot VALUES (?)", [(slot,) for slot in freed[short:]])
+            self.evictions += len(victims)
+        return slots
+
+    def put_many(self, keys, vectors):
+        if not keys or not self.capacity:
+            return
+        with self.locked(exclusive=True):
+            matrix = self._open_matrix(vectors.shape[1])
+            if matrix.shape[1] != vectors.shape[1]:
+                raise ValueError(f"Cache {self.base} lưu vector {matrix.shape[1]} chiều, nhận {vectors.shape[1]}")
+            pending = {}
+            for key, vector in zip(keys, vectors):
+                pending[key] = vector
+            known = set()
+            pending_keys = list(pending)
+            for start in range(0, len(pending_keys), 500):
+                chunk = pending_keys[start:start + 500]
+                known.update(row[0] for row in self.db.execute(
+                    f"SELECT key FROM embedding WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                ))
+            new_keys = [key for key in pending_keys if key not in known][:self.capacity]
+            if not new_keys:
+                return
+            slots = self._allocate(len(new_keys))
+            for key, slot in zip(new_keys, slots):
+                matrix[slot] = pending[key]
+            matrix.flush()
+            now = time.time()
+            self.db.executemany(
+                "INSERT INTO embedding (key, slot, last_used) VALUES (?, ?, ?)",
+                [(key, slot, now) for key, slot in zip(new_keys, slots)]
+            )
+            self.db.commit()
+
+    def stats(self):
+        with self.locked(exclusive=False):
+            entries = self.db.execute("SELECT COUNT(*) FROM embedding").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "model_name": self.model_name,
+            "path": self.base,
+            "entries": entries,
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+def cached_encode(cache, texts, encode):
+    """Encode texts qua cache: chỉ các văn bản (đã chuẩn hóa) chưa có trong cache mới gọi model.
+
+    encode nhận list văn bản và trả về ma trận float32 đã chuẩn hóa; cache=None thì gọi thẳng.
+    """
+    normalized = [normalize_text(text) for text in texts]
+    if cache is None:
+        return encode(normalized)
+    keys = [text_key(text) for text in normalized]
+    found = cache.get_many(keys)
+    missing = list(dict.fromkeys(key for key in keys if key not in found))
+    if missing:
+        text_of = dict(zip(keys, normalized))
+        vectors = encode([text_of[key] for key in missing])
+        cache.put_many(missing, vectors)
+        found.update(zip(missing, vectors))
+    return np.stack([found[key] for key in keys]).astype("float32") if keys else encode(normalized)
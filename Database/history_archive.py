@@ -0,0 +1,260 @@
+import os
+import re
+import gzip
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from dotenv import load_dotenv
+from Database.storage import engine, run_write, chunked, in_params, normalize_date_filter
+from Database.ids import next_id
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khóa trong process
+    fcntl = None
+
+load_dotenv()
+
+HISTORY_ARCHIVE_PATH = os.getenv("HISTORY_ARCHIVE_PATH", "history_archive")
+# Số ngày gần nhất giữ trong history_table, cũ hơn thì chuyển ra file lưu trữ
+HISTORY_HOT_DAYS = int(os.getenv("HISTORY_HOT_DAYS", "30"))
+# Chu kỳ (giây) chạy lưu trữ nền trong app, 0 để tắt
+HISTORY_ARCHIVE_INTERVAL = float(os.getenv("HISTORY_ARCHIVE_INTERVAL", "3600"))
+HISTORY_COLUMNS = ["id", "request", "response", "timestamp", "user_rating"]
+
+_lock = threading.Lock()
+
+@contextmanager
+def archive_lock(root=HISTORY_ARCHIVE_PATH):
+    """Chỉ một process/thread lưu trữ hoặc gộp file tại một thời điểm"""
+    os.makedirs(root, exist_ok=True)
+    with _lock, open(os.path.join(root, ".lock"), "a") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+def cutoff_day(hot_days=HISTORY_HOT_DAYS, now=None):
+    """Ngày đầu tiên của cửa sổ nóng: history có timestamp trước ngày này được lưu trữ"""
+    return ((now or datetime.now()) - timedelta(days=hot_days)).strftime("%Y-%m-%d")
+
+def next_day(day):
+    return (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+def partition_file(day):
+    """Đường dẫn (tương đối) của một file lưu trữ mới cho ngày day: YYYY/MM/history-YYYY-MM-DD-<id>.ndjson.gz"""
+    return f"{day[:4]}/{day[5:7]}/history-{day}-{next_id()}.ndjson.gz"
+
+def file_day(path):
+    match = re.search(r"history-(\d{4}-\d{2}-\d{2})-\d+\.ndjson\.gz$", path)
+    return match.group(1) if match else None
+
+def write_partition(root, path, rows):
+    """Ghi các dòng history ra file NDJSON nén gzip (ghi file tạm, fsync rồi os.replace)"""
+    full_path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    tmp_path = f"{full_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+            for row in rows:
+                f.write((json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, full_path)
+
+def read_partition(root, path):
+    with gzip.open(os.path.join(root, path), "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def archivable_days(conn, cutoff):
+    rows = conn.execute(text(
+        "SELECT DISTINCT substr(timestamp, 1, 10) FROM history_table "
+        "WHERE timestamp IS NOT NULL AND timestamp < :cutoff"
+    ), {"cutoff": cutoff})
+    # Dòng không có ngày hợp lệ được giữ lại trong history_table
+    return sorted(day for (day,) in rows if day and re.match(r"^\d{4}-\d{2}-\d{2}$", day))
+
+def index_partition(conn, path, rows, delete_hot):
+    """Ghi chỉ mục cho các dòng của một file; delete_hot=True thì xóa các dòng đó khỏi history_table.
+
+    user_rating đọc lại (từ history_table, hoặc chỉ mục cũ khi gộp file) lúc commit để không
+    mất đánh giá được cập nhật trong lúc đang ghi file.
+    """
+    ratings = {row["id"]: row["user_rating"] for row in rows}
+    ids = list(ratings)
+    source = "history_table" if delete_hot else "history_archive"
+    for chunk in chunked(ids):
+        params, placeholders = in_params(chunk)
+        current = conn.execute(text(f"SELECT id, user_rating FROM {source} WHERE id IN ({placeholders})"), params)
+        ratings.update({id: rating for id, rating in current})
+    conn.execute(text(
+        "INSERT OR REPLACE INTO history_archive (id, timestamp, file, line, user_rating) "
+        "VALUES (:id, :timestamp, :file, :line, :user_rating)"
+    ), [
+        {"id": row["id"], "timestamp": row["timestamp"], "file": path, "line": line, "user_rating": ratings[row["id"]] or ""}
+        for line, row in enumerate(rows)
+    ])
+    if delete_hot:
+        for chunk in chunked(ids):
+            params, placeholders = in_params(chunk)
+            conn.execute(text(f"DELETE FROM history_table WHERE id IN ({placeholders})"), params)
+
+def archive_history(hot_days=HISTORY_HOT_DAYS, root=HISTORY_ARCHIVE_PATH, now=None):
+    """Chuyển history cũ hơn cửa sổ nóng ra các file nén theo ngày và xóa khỏi history_table.
+
+    Mỗi ngày được ghi ra một file rồi mới commit chỉ mục + xóa dòng trong một transaction,
+    nên crash giữa chừng chỉ để lại file thừa (được dọn khi compact_archive), không mất dữ liệu.
+    """
+    if hot_days < 0:
+        raise ValueError("hot_days phải >= 0")
+    cutoff = cutoff_day(hot_days, now)
+    archived = 0
+    files = []
+    with archive_lock(root):
+        with engine.connect() as conn:
+            days = archivable_days(conn, cutoff)
+        for day in days:
+            with engine.connect() as conn:
+                rows = [dict(row) for row in conn.execute(text(
+                    f"SELECT {', '.join(HISTORY_COLUMNS)} FROM history_table "
+                    "WHERE timestamp >= :day AND timestamp < :end ORDER BY timestamp, id"
+                ), {"day": day, "end": next_day(day)}).mappings()]
+            if not rows:
+                continue
+            path = partition_file(day)
+            write_partition(root, path, rows)
+            run_write(lambda conn: index_partition(conn, path, rows, delete_hot=True))
+            archived += len(rows)
+            files.append(path)
+    if archived:
+        print(f"[archive] Đã lưu trữ {archived} history (trước {cutoff}) vào {len(files)} file")
+    return {"cutoff": cutoff, "archived": archived, "files": files}
+
+def referenced_files(conn):
+    return {path for (path,) in conn.execute(text("SELECT DISTINCT file FROM history_archive"))}
+
+def compact_archive(root=HISTORY_ARCHIVE_PATH):
+    """Gộp các file của cùng một ngày thành một file và xóa file không còn trong chỉ mục"""
+    merged = removed = 0
+    with archive_lock(root):
+        with engine.connect() as conn:
+            files = referenced_files(conn)
+        by_day = {}
+        for path in files:
+            by_day.setdefault(file_day(path), []).append(path)
+        for day, paths in by_day.items():
+            if day is None or len(paths) < 2:
+                continue
+            rows = []
+            with engine.connect() as conn:
+                for path in sorted(paths):
+                    rows.extend(load_records(conn, path, root))
+            rows.sort(key=lambda row: (row["timestamp"], row["id"]))
+            path = partition_file(day)
+            write_partition(root, path, rows)
+            run_write(lambda conn: index_partition(conn, path, rows, delete_hot=False))
+            files.difference_update(paths)
+            files.add(path)
+            merged += len(paths)
+
+        # File thừa: đã thay bằng file gộp, hoặc ghi xong nhưng crash trước khi commit chỉ mục
+        for dir_path, _, names in os.walk(root):
+            for name in names:
+                full_path = os.path.join(dir_path, name)
+                path = os.path.relpath(full_path, root).replace(os.sep, "/")
+                if (name.endswith(".ndjson.gz") and path not in files) or name.endswith(".tmp"):
+                    os.remove(full_path)
+                    removed += 1
+    return {"merged_files": merged, "removed_files": removed}
+
+def load_records(conn, path, root=HISTORY_ARCHIVE_PATH):
+    """Các bản ghi còn trong chỉ mục của một file, user_rating lấy theo chỉ mục"""
+    indexed = {
+        line: rating for line, rating in conn.execute(
+            text("SELECT line, user_rating FROM history_archive WHERE file = :file"), {"file": path}
+        )
+    }
+    records = []
+    for line, record in enumerate(read_partition(root, path)):
+        if line in indexed:
+            record["user_rating"] = indexed[line] or ""
+            records.append(record)
+    return records
+
+def hydrate(index_rows, root=HISTORY_ARCHIVE_PATH):
+    """Đọc bản ghi đầy đủ cho các dòng chỉ mục (mỗi file chỉ giải nén một lần), giữ nguyên thứ tự"""
+    lines_by_file = {}
+    for row in index_rows:
+        lines_by_file.setdefault(row["file"], set()).add(row["line"])
+    contents = {}
+    for path, lines in lines_by_file.items():
+        contents[path] = {line: record for line, record in enumerate(read_partition(root, path)) if line in lines}
+    records = []
+    for row in index_rows:
+        record = dict(contents[row["file"]][row["line"]])
+        record["user_rating"] = row["user_rating"] or ""
+        records.append(record)
+    return records
+
+def get_archived_history(id, root=HISTORY_ARCHIVE_PATH):
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT id, file, line, user_rating FROM history_archive WHERE id = :id"), {"id": id}
+        ).mappings().first()
+    return hydrate([row], root)[0] if row else None
+
+def query_archive(limit=50, since=None, until=None, after=None, root=HISTORY_ARCHIVE_PATH):
+    """Tối đa limit bản ghi đã lưu trữ theo (timestamp DESC, id DESC), lọc theo ngày qua chỉ mục.
+
+    after là (timestamp, id) của dòng cuối trang trước (keyset).
+    """
+    since = normalize_date_filter(since)
+    until = normalize_date_filter(until)
+    conditions, params = [], {"limit": limit}
+    if since:
+        conditions.append("timestamp >= :since")
+        params["since"] = since
+    if until:
+        conditions.append("timestamp < :until")
+        params["until"] = next_day(until)
+    if after is not None:
+        conditions.append("(timestamp, id) < (:after_timestamp, :after_id)")
+        params["after_timestamp"], params["after_id"] = after
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            f"SELECT id, timestamp, file, line, user_rating FROM history_archive {where}"
+            "ORDER BY timestamp DESC, id DESC LIMIT :limit"
+        ), params).mappings().all()
+    return hydrate(rows, root)
+
+def update_archived_rating(id, user_rating):
+    return run_write(lambda conn: conn.execute(
+        text("UPDATE history_archive SET user_rating = :user_rating WHERE id = :id"),
+        {"id": id, "user_rating": user_rating}
+    ).rowcount)
+
+def archive_stats(root=HISTORY_ARCHIVE_PATH):
+    with engine.connect() as conn:
+        hot = conn.execute(text("SELECT COUNT(*), MIN(timestamp) FROM history_table")).first()
+        archived = conn.execute(text("SELECT COUNT(*), COUNT(DISTINCT file), MIN(timestamp), MAX(timestamp) FROM history_archive")).first()
+    size = 0
+    for dir_path, _, names in os.walk(root):
+        size += sum(os.path.getsize(os.path.join(dir_path, name)) for name in names if name.endswith(".ndjson.gz"))
+    return {
+        "hot_days": HISTORY_HOT_DAYS,
+        "cutoff": cutoff_day(),
+        "hot_rows": hot[0],
+        "oldest_hot_timestamp": hot[1],
+        "archived_rows": archived[0],
+        "archive_files": archived[1],
+        "archive_bytes": size,
+        "oldest_archived_timestamp": archived[2],
+        "newest_archived_timestamp": archived[3],
+        "archive_path": root,
+    }
@@ -0,0 +1,104 @@
+import os
+import time
+import tempfile
+import threading
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có flock, dùng WORKER_ID trong .env
+    fcntl = None
+
+load_dotenv()
+
+# Snowflake 63 bit: 41 bit mili giây tính từ EPOCH | 10 bit worker | 12 bit sequence
+EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+ID_WORKER_DIR = os.getenv("ID_WORKER_DIR", os.path.join(tempfile.gettempdir(), "news_id_workers"))
+
+def claim_worker_id(lock_dir=ID_WORKER_DIR):
+    """Chọn worker id riêng cho process hiện tại.
+
+    Ưu tiên WORKER_ID trong .env; nếu không có thì giữ flock trên một file worker-<n>.lock
+    còn trống. Lock được giữ đến khi process kết thúc nên hai worker đang chạy không bao
+    giờ trùng id (kể cả khi một worker cũ bị kill, lock được hệ điều hành nhả ra).
+    """
+    worker_id = os.getenv("WORKER_ID")
+    if worker_id is not None:
+        worker_id = int(worker_id)
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"WORKER_ID phải nằm trong [0, {MAX_WORKER_ID}]")
+        return worker_id, None
+    if fcntl is None:
+        return os.getpid() & MAX_WORKER_ID, None
+
+    os.makedirs(lock_dir, exist_ok=True)
+    for worker_id in range(MAX_WORKER_ID + 1):
+        handle = open(os.path.join(lock_dir, f"worker-{worker_id}.lock"), "a")
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        return worker_id, handle
+    raise RuntimeError(f"Hết worker id trong {lock_dir}")
+
+class SnowflakeGenerator:
+    """Sinh id số nguyên tăng dần theo thời gian, không cần đọc database"""
+
+    def __init__(self, worker_id=None):
+        self.lock_handle = None
+        if worker_id is None:
+            worker_id, self.lock_handle = claim_worker_id()
+        self.worker_id = worker_id
+        self.last_ms = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        with self.lock:
+            now = int(time.time() * 1000)
+            # Đồng hồ bị lùi (NTP) thì tiếp tục từ mốc cũ để id không bị trùng
+            now = max(now, self.last_ms)
+            if now == self.last_ms:
+                self.sequence = (self.sequence + 1) & MAX_SEQUENCE
+                if self.sequence == 0:
+                    # Hết 4096 id trong mili giây này, chờ sang mili giây kế tiếp
+                    while now <= self.last_ms:
+                        now = int(time.time() * 1000)
+                        if now <= self.last_ms:
+                            time.sleep(0.0001)
+            else:
+                self.sequence = 0
+            self.last_ms = now
+            return ((now - EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self.sequence
+
+_generator = None
+_generator_lock = threading.Lock()
+_generator_pid = None
+
+def get_generator():
+    """Generator của process hiện tại (tạo lại sau fork để worker con có worker id riêng)"""
+    global _generator, _generator_pid
+    with _generator_lock:
+        if _generator is None or _generator_pid != os.getpid():
+            _generator = SnowflakeGenerator()
+            _generator_pid = os.getpid()
+        return _generator
+
+def next_id():
+    return get_generator().next_id()
+
+def new_news_id():
+    """Id bài báo dạng "ID<snowflake>" """
+    return f"ID{next_id()}"
+
+def new_history_id():
+    """Id lịch sử dạng "CA<snowflake>" """
+    return f"CA{next_id()}"
+
+def new_ttp_id():
+    return next_id()
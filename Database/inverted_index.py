@@ -0,0 +1,307 @@
+import os
+import json
+import math
+import time
+import heapq
+import shutil
+import threading
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows: không khóa giữa các process
+    fcntl = None
+
+load_dotenv()
+
+INVERTED_INDEX_PATH = os.getenv("INVERTED_INDEX_PATH", "news_inverted_index")
+# Term dài hơn giới hạn này (thường là chuỗi rác) không được đưa vào từ điển term
+MAX_TERM_LENGTH = 64
+# Khi số bài thêm/xóa kể từ lần build vượt tỉ lệ này thì build lại ở background
+REBUILD_RATIO = 0.1
+MIN_REBUILD_CHANGES = 1000
+ARRAY_NAMES = ("terms", "offsets", "postings_doc", "postings_tf", "doc_len", "doc_day", "doc_outlet", "doc_ids")
+
+def day_to_int(day):
+    """"2025-03-19" -> 20250319, 0 nếu không có ngày"""
+    return int(day.replace("-", "")) if day else 0
+
+@contextmanager
+def build_lock(path=INVERTED_INDEX_PATH):
+    """flock trên file LOCK trong thư mục index: mỗi lúc chỉ một process build/publish generation"""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "LOCK"), "a") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+def generation_version(path, generation):
+    """corpus_version của generation, None nếu generation thiếu file (đã bị xóa hoặc ghi dở)"""
+    gen_path = os.path.join(path, generation)
+    if not all(os.path.exists(os.path.join(gen_path, f"{name}.npy")) for name in ARRAY_NAMES):
+        return None
+    try:
+        with open(os.path.join(gen_path, "meta.json"), encoding="utf-8") as f:
+            return json.load(f)["corpus_version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def generation_number(name):
+    return int(name[len("gen-"):])
+
+def build_inverted_index(docs, path=INVERTED_INDEX_PATH, k1=1.5, b=0.75, corpus_version=None):
+    """Ghi chỉ mục đảo dạng CSR ra một generation mới trong thư mục path.
+
+    docs là iterable (news_id, tokens, day "YYYY-MM-DD", outlet). Các file .npy:
+    terms (đã sắp xếp), offsets, postings_doc, postings_tf, doc_len, doc_day, doc_outlet,
+    doc_ids (đã sắp xếp). File CURRENT trỏ tới generation đang dùng và được thay thế
+    nguyên tử, nên các worker đang đọc generation cũ không bị ảnh hưởng.
+
+    Cả lần build giữ build_lock; nếu generation hiện tại đã có corpus_version mới bằng
+    (hoặc mới hơn) thì không build, trả về đường dẫn generation đó.
+    """
+    with build_lock(path):
+        previous = read_current_generation(path)
+        if previous is not None and corpus_version is not None:
+            current_version = generation_version(path, previous)
+            if current_version is not None and current_version >= corpus_version:
+                return os.path.join(path, previous)
+        gen_path = _write_generation(sorted(docs, key=lambda doc: doc[0]), path, k1, b, corpus_version)
+        generation = os.path.basename(gen_path)
+        current_tmp = os.path.join(path, f"CURRENT.{os.getpid()}.tmp")
+        with open(current_tmp, "w", encoding="utf-8") as f:
+            f.write(generation)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(current_tmp, os.path.join(path, "CURRENT"))
+        # Giữ lại generation ngay trước đó cho worker còn đang mmap, chỉ xóa các bản cũ hơn nó
+        if previous is not None:
+            for name in os.listdir(path):
+                if name.startswith("gen-") and generation_number(name) < generation_number(previous):
+                    shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+        return gen_path
+
+def _write_generation(docs, path, k1, b, corpus_version):
+    """Ghi các mảng CSR + meta.json của docs (đã sắp theo news_id) vào thư mục gen-* mới"""
+    vocab = {}
+    term_ids, doc_idx, tfs = array("q"), array("q"), array("q")
+    doc_len = np.zeros(len(docs), dtype=np.int32)
+    doc_day = np.zeros(len(docs), dtype=np.int32)
+    outlets = {}
+    doc_outlet = np.zeros(len(docs), dtype=np.int32)
+    for i, (news_id, tokens, day, outlet) in enumerate(docs):
+        counts = defaultdict(int)
+        for token in tokens:
+            if len(token) <= MAX_TERM_LENGTH:
+                counts[token] += 1
+        for term, freq in counts.items():
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            doc_idx.append(i)
+            tfs.append(freq)
+        doc_len[i] = len(tokens)
+        doc_day[i] = day_to_int(day)
+        doc_outlet[i] = outlets.setdefault(outlet, len(outlets))
+
+    terms = sorted(vocab)
+    # Đổi id term theo thứ tự từ điển để postings của mỗi term nằm liền nhau
+    remap = np.empty(len(vocab), dtype=np.int64)
+    for new_id, term in enumerate(terms):
+        remap[vocab[term]] = new_id
+    term_ids = remap[np.frombuffer(term_ids, dtype=np.int64)] if len(term_ids) else np.zeros(0, dtype=np.int64)
+    order = np.argsort(term_ids, kind="stable")
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=offsets[1:])
+
+    generation = f"gen-{time.time_ns()}"
+    gen_path = os.path.join(path, generation)
+    os.makedirs(gen_path, exist_ok=True)
+    arrays = {
+        "terms": np.array(terms, dtype=f"<U{max((len(t) for t in terms), default=1)}"),
+        "offsets": offsets,
+        "postings_doc": np.frombuffer(doc_idx, dtype=np.int64)[order].astype(np.int32),
+        "postings_tf": np.minimum(np.frombuffer(tfs, dtype=np.int64)[order], 65535).astype(np.uint16),
+        "doc_len": doc_len,
+        "doc_day": doc_day,
+        "doc_outlet": doc_outlet,
+        "doc_ids": np.array([doc[0] for doc in docs], dtype=f"<U{max((len(doc[0]) for doc in docs), default=1)}"),
+    }
+    for name, values in arrays.items():
+        np.save(os.path.join(gen_path, f"{name}.npy"), values)
+    meta = {
+        "n_docs": len(docs),
+        "total_len": int(doc_len.sum()),
+        "k1": k1,
+        "b": b,
+        "outlets": sorted(outlets, key=outlets.get),
+        "corpus_version": corpus_version,
+        "created": time.time(),
+    }
+    with open(os.path.join(gen_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return gen_path
+
+def read_current_generation(path=INVERTED_INDEX_PATH):
+    try:
+        with open(os.path.join(path, "CURRENT"), encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+class MmapInvertedIndex:
+    """Chỉ mục đảo BM25 đọc bằng mmap (các worker uvicorn dùng chung page cache).
+
+    Điểm BM25 được tính vector hóa trên mảng postings của các term trong query. Bài thêm
+    sau lần build nằm trong một delta nhỏ trong bộ nhớ, bài bị xóa được đánh dấu; cả hai
+    dùng chung thống kê df/avgdl với phần đã build.
+    """
+
+    def __init__(self, path=INVERTED_INDEX_PATH):
+        self.path = path
+        self.generation = read_current_generation(path)
+        if self.generation is None:
+            raise FileNotFoundError(f"Chưa có chỉ mục đảo tại {path}")
+        gen_path = os.path.join(path, self.generation)
+        with open(os.path.join(gen_path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        for name in ARRAY_NAMES:
+            setattr(self, name, np.load(os.path.join(gen_path, f"{name}.npy"), mmap_mode="r"))
+        self.k1 = self.meta["k1"]
+        self.b = self.meta["b"]
+        self.outlets = self.meta["outlets"]
+        self.deleted = set()      # chỉ số bài (trong phần đã build) đã bị xóa
+        self.deleted_len = 0
+        self.delta = defaultdict(dict)   # term -> {news_id: tf}
+        self.delta_docs = {}             # news_id -> (terms, doc_len, day_int, outlet)
+        self.applied = 0                 # số lần add/remove kể từ khi load
+        self.lock = threading.RLock()
+
+    def carry_over(self, old):
+        """Chuyển delta và các bài đã xóa từ index cũ sang generation mới vừa load"""
+        with old.lock, self.lock:
+            for news_id, doc in old.delta_docs.items():
+                if self.doc_index(news_id) is None:
+                    for term in doc[0]:
+                        self.delta[term][news_id] = old.delta[term][news_id]
+                    self.delta_docs[news_id] = doc
+            for i in old.deleted:
+                j = self.doc_index(str(old.doc_ids[i]))
+                if j is not None and j not in self.deleted:
+                    self.deleted.add(j)
+                    self.deleted_len += int(self.doc_len[j])
+
+    @property
+    def changes(self):
+        return len(self.deleted) + len(self.delta_docs)
+
+    @property
+    def needs_rebuild(self):
+        return self.changes > max(MIN_REBUILD_CHANGES, REBUILD_RATIO * self.meta["n_docs"])
+
+    def doc_index(self, news_id):
+        i = int(np.searchsorted(self.doc_ids, news_id))
+        return i if i < len(self.doc_ids) and self.doc_ids[i] == news_id else None
+
+    def add(self, news_id, tokens, day, outlet):
+        with self.lock:
+            self.remove(news_id)
+            counts = defaultdict(int)
+            for token in tokens:
+                counts[token] += 1
+            for term, freq in counts.items():
+                self.delta[term][news_id] = freq
+            self.delta_docs[news_id] = (tuple(counts), len(tokens), day_to_int(day), outlet)
+
+    def remove(self, news_id):
+        with self.lock:
+            self.applied += 1
+            if news_id in self.delta_docs:
+                for term in self.delta_docs.pop(news_id)[0]:
+                    self.delta[term].pop(news_id, None)
+                    if not self.delta[term]:
+                        del self.delta[term]
+                return
+            i = self.doc_index(news_id)
+            if i is not None and i not in self.deleted:
+                self.deleted.add(i)
+                self.deleted_len += int(self.doc_len[i])
+
+    def term_postings(self, term):
+        i = int(np.searchsorted(self.terms, term))
+        if i < len(self.terms) and self.terms[i] == term:
+            start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+            return self.postings_doc[start:end], self.postings_tf[start:end]
+        return None, None
+
+    def search(self, tokens, top_k=10, since=None, until=None, outlet_filter=None):
+        """Trả về [(news_id, score)] của top_k bài có điểm BM25 cao nhất"""
+        since_int = day_to_int(since) if since else None
+        until_int = day_to_int(until) if until else None
+        allowed_outlets = None
+        if outlet_filter is not None:
+            allowed_outlets = np.array([i for i, outlet in enumerate(self.outlets) if outlet_filter(outlet)], dtype=np.int32)
+
+        with self.lock:
+            n_docs = self.meta["n_docs"] - len(self.deleted) + len(self.delta_docs)
+            if n_docs <= 0 or not tokens:
+                return []
+            total_len = self.meta["total_len"] - self.deleted_len + sum(doc[1] for doc in self.delta_docs.values())
+            avgdl = total_len / n_docs or 1.0
+            deleted = np.fromiter(self.deleted, dtype=np.int32) if self.deleted else None
+
+            docs, contribs = [], []
+            delta_scores = defaultdict(float)
+            for term in tokens:
+                doc_idx, tf = self.term_postings(term)
+                delta_posting = self.delta.get(term, {})
+                df = (len(doc_idx) if doc_idx is not None else 0) + len(delta_posting)
+                if not df:
+                    continue
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+                if doc_idx is not None and len(doc_idx):
+                    mask = np.ones(len(doc_idx), dtype=bool)
+                    if since_int or until_int:
+                        days = self.doc_day[doc_idx]
+                        mask &= days > 0
+                        if since_int:
+                            mask &= days >= since_int
+                        if until_int:
+                            mask &= days <= until_int
+                    if allowed_outlets is not None:
+                        mask &= np.isin(self.doc_outlet[doc_idx], allowed_outlets)
+                    if deleted is not None:
+                        mask &= ~np.isin(doc_idx, deleted)
+                    doc_idx, tf = doc_idx[mask], tf[mask].astype(np.float32)
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_idx] / avgdl)
+                    docs.append(doc_idx)
+                    contribs.append(idf * tf * (self.k1 + 1) / (tf + norm))
+
+                for news_id, freq in delta_posting.items():
+                    _, length, day, outlet = self.delta_docs[news_id]
+                    if (since_int or until_int) and not day:
+                        continue
+                    if (since_int and day < since_int) or (until_int and day > until_int):
+                        continue
+                    if outlet_filter is not None and not outlet_filter(outlet):
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * length / avgdl)
+                    delta_scores[news_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+
+            hits = []
+            if docs:
+                unique_docs, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+                scores = np.bincount(inverse, weights=np.concatenate(contribs))
+                if len(scores) > top_k:
+                    top = np.argpartition(-scores, top_k)[:top_k]
+                else:
+                    top = np.arange(len(scores))
+                hits = [(str(self.doc_ids[unique_docs[i]]), float(scores[i])) for i in top]
+        return heapq.nlargest(top_k, hits + list(delta_scores.items()), key=lambda item: item[1])
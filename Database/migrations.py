@@ -0,0 +1,164 @@
+from sqlalchemy import text
+from Database.storage import run_write
+from Database.ids import new_news_id, new_history_id, new_ttp_id
+
+# Schema hiện tại của các bảng chính (version 1)
+SCHEMA = {
+    "news_table": [
+        """CREATE TABLE IF NOT EXISTS news_table (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            content TEXT,
+            date TEXT,
+            source TEXT
+        )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_news_title ON news_table (title)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_news_source ON news_table (source)",
+        "CREATE INDEX IF NOT EXISTS idx_news_date ON news_table (date, id)",
+    ],
+    "ttp_table": [
+        """CREATE TABLE IF NOT EXISTS ttp_table (
+            id INTEGER PRIMARY KEY,
+            pattern TEXT NOT NULL,
+            category TEXT,
+            ttp TEXT,
+            source TEXT
+        )""",
+        # Giữ quy tắc cũ: bỏ qua TTP nếu pattern hoặc category đã tồn tại
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_ttp_pattern ON ttp_table (pattern)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_ttp_category ON ttp_table (category)",
+    ],
+    "history_table": [
+        """CREATE TABLE IF NOT EXISTS history_table (
+            id TEXT PRIMARY KEY,
+            request TEXT,
+            response TEXT,
+            timestamp TEXT,
+            user_rating TEXT DEFAULT ''
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history_table (timestamp, id)",
+    ],
+}
+
+TABLE_COLUMNS = {
+    "news_table": ["id", "title", "content", "date", "source"],
+    "ttp_table": ["id", "pattern", "category", "ttp", "source"],
+    "history_table": ["id", "request", "response", "timestamp", "user_rating"],
+}
+
+def table_columns(conn, table):
+    """{tên cột: có phải khóa chính}; rỗng nếu bảng chưa tồn tại"""
+    return {row[1]: bool(row[5]) for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+
+def clean_legacy_row(table, row):
+    """Chuẩn hóa một dòng của bảng cũ (pandas to_sql) theo ràng buộc của schema mới"""
+    row = {column: row.get(column) for column in TABLE_COLUMNS[table]}
+    for column, value in row.items():
+        if value is not None and not isinstance(value, (str, int, float)):
+            row[column] = str(value)
+    if table == "news_table":
+        if not row["title"]:
+            return None
+        row["id"] = str(row["id"]) if row["id"] else new_news_id()
+        row["source"] = row["source"] or None  # Link rỗng lưu NULL để không vướng UNIQUE index
+    elif table == "ttp_table":
+        if not row["pattern"]:
+            return None
+        if not isinstance(row["id"], int):
+            row["id"] = new_ttp_id()
+        row["category"] = row["category"] or None
+    else:
+        row["id"] = str(row["id"]) if row["id"] else new_history_id()
+        row["user_rating"] = row["user_rating"] or ""
+    return row
+
+def rebuild_legacy_table(conn, table, batch_size=1000):
+    """Chuyển bảng tạo bởi pandas (không khóa chính/index) sang schema mới, giữ toàn bộ dữ liệu.
+
+    Dòng trùng khóa chính hoặc UNIQUE index thì giữ dòng xuất hiện trước (theo rowid),
+    dòng thiếu giá trị bắt buộc (title, pattern) bị bỏ qua.
+    """
+    legacy = f"{table}_legacy"
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    for statement in SCHEMA[table]:
+        conn.execute(text(statement))
+
+    columns = TABLE_COLUMNS[table]
+    insert = text(
+        f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join(':' + column for column in columns)})"
+    )
+    copied = skipped = 0
+    result = conn.execute(text(f"SELECT * FROM {legacy} ORDER BY rowid"))
+    while True:
+        rows = result.mappings().fetchmany(batch_size)
+        if not rows:
+            break
+        cleaned = [clean_legacy_row(table, dict(row)) for row in rows]
+        batch = [row for row in cleaned if row is not None]
+        if batch:
+            copied += conn.execute(insert, batch).rowcount
+        skipped += len(rows) - len(batch)
+    skipped += conn.execute(text(f"SELECT COUNT(*) FROM {legacy}")).scalar() - copied - skipped
+    conn.execute(text(f"DROP TABLE {legacy}"))
+    print(f"[migrate] {table}: chuyển {copied} dòng sang schema mới, bỏ qua {skipped} dòng trùng/thiếu dữ liệu")
+
+def migrate_v1(conn):
+    """Tạo các bảng chính; bảng cũ do pandas tạo (không có khóa chính) được chuyển dữ liệu sang"""
+    for table, statements in SCHEMA.items():
+        columns = table_columns(conn, table)
+        if columns and not any(columns.values()):
+            rebuild_legacy_table(conn, table)
+        else:
+            for statement in statements:
+                conn.execute(text(statement))
+
+def migrate_v2(conn):
+    """Chỉ mục của history đã lưu trữ ra file (Database/history_archive.py)"""
+    conn.execute(text("""CREATE TABLE IF NOT EXISTS history_archive (
+        id TEXT PRIMARY KEY,
+        timestamp TEXT NOT NULL,
+        file TEXT NOT NULL,
+        line INTEGER NOT NULL,
+        user_rating TEXT DEFAULT ''
+    )"""))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_history_archive_timestamp ON history_archive (timestamp, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_history_archive_file ON history_archive (file)"))
+
+def migrate_v3(conn):
+    """Trạng thái crawl: các link đã lấy trang chi tiết (Database/crawl_state.py)"""
+    conn.execute(text("""CREATE TABLE IF NOT EXISTS crawl_state (
+        link TEXT PRIMARY KEY,
+        source TEXT,
+        first_seen TEXT NOT NULL,
+        last_seen TEXT NOT NULL,
+        content_hash TEXT
+    )"""))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_crawl_state_last_seen ON crawl_state (last_seen)"))
+
+# (version, mô tả, hàm migrate). Chỉ thêm migration mới vào cuối, không sửa migration cũ
+MIGRATIONS = [
+    (1, "bảng chính có khóa chính và index", migrate_v1),
+    (2, "chỉ mục history đã lưu trữ", migrate_v2),
+    (3, "trạng thái crawl", migrate_v3),
+]
+
+def schema_version(conn):
+    return conn.execute(text("PRAGMA user_version")).scalar()
+
+def migrate():
+    """Áp dụng các migration chưa chạy (PRAGMA user_version), không xóa dữ liệu.
+
+    Chạy trong writer (BEGIN IMMEDIATE) nên nhiều worker khởi động cùng lúc cũng chỉ
+    một worker thực sự migrate; trả về version sau khi migrate.
+    """
+    def write(conn):
+        version = schema_version(conn)
+        for target, description, apply in MIGRATIONS:
+            if target > version:
+                print(f"[migrate] {version} -> {target}: {description}")
+                apply(conn)
+                conn.execute(text(f"PRAGMA user_version = {target}"))
+                version = target
+        return version
+    return run_write(write)
@@ -0,0 +1,448 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+import numpy as np
+from sqlalchemy import text
+from dotenv import load_dotenv
+from Database.storage import engine, chunked, in_params
+from Database.quantized_encoder import load_encoder, normalize_backend
+from Database.embedding_cache import EmbeddingCache, EMBEDDING_CACHE_SIZE, cached_encode
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khóa trong process
+    fcntl = None
+
+load_dotenv()
+
+VECTORDB_PATH = os.getenv("VECTORDB_PATH", "faiss_ttp.index")
+EMBEDDING_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+# MODEL_WARMUP=0 để bỏ qua bước load model/index lúc khởi động server
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+# Số câu mỗi batch khi encode (CPU thường tốt nhất trong khoảng 32-128)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+TTP_COLUMNS = ["id", "pattern", "category", "ttp", "source"]
+# Số bản ghi tối đa trong file delta của index TTP trước khi gộp (checkpoint) vào file index chính
+TTP_INDEX_CHECKPOINT = int(os.getenv("TTP_INDEX_CHECKPOINT", "1000"))
+DELTA_ADD = 1
+DELTA_REMOVE = -1
+
+
+def process_rss_mb():
+    """RSS hiện tại của process (MB), dùng peak RSS nếu không đọc được /proc"""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        except ImportError:
+            return None
+
+def model_memory_mb(model):
+    """Dung lượng trọng số của encoder (MB)"""
+    if hasattr(model, "session"):
+        return round(os.path.getsize(model.model_path) / 2**20, 1)
+    if hasattr(model, "parameters"):
+        return round(sum(p.numel() * p.element_size() for p in model.parameters()) / 2**20, 1)
+    total = 0
+    for value in model.model.state_dict().values():
+        # Linear int8 lưu trọng số đã đóng gói dưới dạng tuple tensor
+        for tensor in value if isinstance(value, tuple) else (value,):
+            if hasattr(tensor, "element_size"):
+                total += tensor.numel() * tensor.element_size()
+    return round(total / 2**20, 1)
+
+def load_ttp_rows():
+    """Các dòng ttp_table theo thứ tự id"""
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT {', '.join(TTP_COLUMNS)} FROM ttp_table ORDER BY id"))
+        return [dict(row) for row in rows.mappings()]
+
+def load_ttp_rows_by_ids(ids):
+    """{id: dòng ttp_table} của các id còn trong bảng"""
+    rows = {}
+    with engine.connect() as conn:
+        for chunk in chunked(ids):
+            params, placeholders = in_params(chunk)
+            result = conn.execute(text(f"SELECT {', '.join(TTP_COLUMNS)} FROM ttp_table WHERE id IN ({placeholders})"), params)
+            rows.update({row["id"]: dict(row) for row in result.mappings()})
+    return rows
+
+def delta_dtype(dim):
+    """Một bản ghi delta: thao tác (thêm/xóa), ttp id và vector (toàn 0 với thao tác xóa)"""
+    return np.dtype([("op", "<i8"), ("id", "<i8"), ("vector", "<f4", (dim,))])
+
+def ttp_document(row):
+    """Văn bản embedding của một TTP: kết hợp pattern và category"""
+    return f"{row['pattern']} - {row['category']}"
+
+def fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class TtpVectorIndex:
+    """FAISS IndexIDMap2 (inner product) khóa theo ttp_table.id.
+
+    rows giữ dòng ttp_table của từng vector trong index, nên kết quả tìm kiếm luôn khớp
+    với dữ liệu TTP kể cả khi bảng đã thay đổi. Thêm/xóa chỉ đụng tới các dòng thay đổi.
+    """
+
+    def __init__(self, index, rows, mtime=None):
+        self.index = index
+        self.rows = rows      # ttp id -> dòng ttp_table
+        self.mtime = mtime    # mtime của file index lúc load/checkpoint gần nhất
+        self.delta_offset = 0 # số byte của file delta đã áp dụng vào index
+        self.lock = threading.RLock()
+
+    @classmethod
+    def empty(cls, dim):
+        import faiss
+        return cls(faiss.IndexIDMap2(faiss.IndexFlatIP(dim)), {})
+
+    def stored_ids(self):
+        import faiss
+        return faiss.vector_to_array(self.index.id_map).tolist()
+
+    def add(self, rows, embeddings):
+        with self.lock:
+            self.remove([row["id"] for row in rows])  # Thay thế nếu id đã có (áp dụng lại delta)
+            self.index.add_with_ids(embeddings, np.array([row["id"] for row in rows], dtype="int64"))
+            for row in rows:
+                self.rows[row["id"]] = row
+
+    def remove(self, ids):
+        with self.lock:
+            ids = [id for id in ids if id in self.rows]
+            if ids:
+                self.index.remove_ids(np.array(ids, dtype="int64"))
+                for id in ids:
+                    del self.rows[id]
+            return len(ids)
+
+    def search(self, embeddings, top_k):
+        """[(dòng ttp_table, score)] cho từng vector query"""
+        with self.lock:
+            if not self.index.ntotal:
+                return [[] for _ in range(len(embeddings))]
+            D, I = self.index.search(embeddings, min(top_k, self.index.ntotal))
+            return [
+                [(self.rows[int(id)], float(score)) for score, id in zip(scores, ids) if int(id) in self.rows]
+                for scores, ids in zip(D, I)
+            ]
+
+    @property
+    def size_mb(self):
+        return round(self.index.ntotal * self.index.d * 4 / 2**20, 2)
+
+class ModelRegistry:
+    """Model embedding và FAISS index TTP dùng chung trong process, chỉ load một lần"""
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, ttp_index_path=VECTORDB_PATH, backend=None):
+        self.model_name = model_name
+        self.backend = normalize_backend(backend)
+        self.ttp_index_path = ttp_index_path
+        self._model = None
+        self._ttp = None
+        self._cache = None
+        self.lock = threading.RLock()
+        self.load_times = {}
+        self.swaps = 0
+        self.checkpoints = 0
+        self.warmed_up = False
+
+    def get_model(self):
+        model = self._model
+        if model is None:
+            with self.lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    self._model = load_encoder(self.model_name, self.backend)
+                    self.load_times["model_seconds"] = round(time.perf_counter() - start, 3)
+                    print(f"Đã load model {self.model_name} ({self.backend}) trong {self.load_times['model_seconds']}s")
+                model = self._model
+        return model
+
+    def get_cache(self):
+        """Cache embedding trên đĩa của model hiện tại (None nếu tắt hoặc không mở được)"""
+        if self._cache is None and EMBEDDING_CACHE_SIZE > 0:
+            with self.lock:
+                if self._cache is None:
+                    try:
+                        # Mỗi backend cho vector hơi khác nhau nên dùng cache riêng
+                        cache_name = self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}"
+                        self._cache = EmbeddingCache(cache_name)
+                    except (OSError, ValueError) as e:
+                        print(f"[X] Không mở được cache embedding: {e}")
+                        self._cache = False
+        return self._cache or None
+
+    def encode(self, texts, batch_size=EMBEDDING_BATCH_SIZE):
+        """Embedding đã chuẩn hóa (float32); văn bản đã có trong cache không cần chạy model"""
+        def encode_with_model(batch):
+            return self.get_model().encode(batch, batch_size=batch_size, normalize_embeddings=True).astype("float32")
+        return cached_encode(self.get_cache(), texts, encode_with_model)
+
+    @property
+    def ttp_delta_path(self):
+        return f"{self.ttp_index_path}.delta"
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.ttp_index_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _delta_size(self):
+        try:
+            return os.stat(self.ttp_delta_path).st_size
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def ttp_file_lock(self, exclusive):
+        """flock dùng chung giữa các worker: ghi delta/checkpoint (exclusive) loại trừ nhau và loại trừ đọc"""
+        dir_path = os.path.dirname(self.ttp_index_path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        with open(f"{self.ttp_index_path}.lock", "a") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+    def _ttp_files_changed(self, ttp):
+        mtime = self._file_mtime()
+        return (mtime is not None and ttp.mtime != mtime) or self._delta_size() != ttp.delta_offset
+
+    def get_ttp_index(self):
+        """Index TTP hiện tại; áp dụng phần delta worker khác mới ghi thêm, load lại sau checkpoint"""
+        ttp = self._ttp
+        if ttp is None or self._ttp_files_changed(ttp):
+            with self.lock:
+                if self._ttp is None:
+                    self.load_ttp_index()
+                elif self._ttp_files_changed(self._ttp):
+                    with self.ttp_file_lock(exclusive=False):
+                        self.refresh_ttp_index(self._ttp)
+                ttp = self._ttp
+        return ttp
+
+    def refresh_ttp_index(self, ttp):
+        """Bắt kịp file: chỉ đọc phần delta mới, hoặc đọc lại cả index nếu worker khác đã checkpoint.
+
+        Gọi khi đang giữ self.lock và ttp_file_lock; trả về index hiện tại.
+        """
+        if ttp.mtime != self._file_mtime() or self._delta_size() < ttp.delta_offset:
+            loaded = self._read_ttp_files({row["id"]: row for row in load_ttp_rows()})
+            if loaded is not None:
+                self.swap_ttp_index(loaded[0])
+                return loaded[0]
+        self._apply_delta(ttp)
+        return ttp
+
+    def _read_ttp_files(self, rows):
+        """(index, số vector thừa đã bỏ) đọc từ file index chính + file delta; None nếu chưa có file
+        hoặc file theo định dạng cũ. rows là {id: dòng ttp_table}, vector không còn dòng bị bỏ."""
+        import faiss
+        mtime = self._file_mtime()
+        if mtime is None:
+            return None
+        index = faiss.read_index(self.ttp_index_path)
+        if not isinstance(index, faiss.IndexIDMap2):
+            print(f"Index TTP {self.ttp_index_path} theo vị trí (định dạng cũ), build lại theo id")
+            return None
+        ttp = TtpVectorIndex(index, {}, mtime)
+        stored = ttp.stored_ids()
+        stale = [id for id in stored if id not in rows]
+        if stale:
+            ttp.index.remove_ids(np.array(stale, dtype="int64"))
+        ttp.rows = {id: rows[id] for id in stored if id in rows}
+        self._apply_delta(ttp, rows)
+        return ttp, len(stale)
+
+    def _apply_delta(self, ttp, rows=None):
+        """Áp dụng các bản ghi delta từ ttp.delta_offset; bản ghi ghi dở (crash) ở cuối file bị bỏ qua"""
+        dtype = delta_dtype(ttp.index.d)
+        count = (self._delta_size() - ttp.delta_offset) // dtype.itemsize
+        if count <= 0:
+            return 0
+        with open(self.ttp_delta_path, "rb") as f:
+            f.seek(ttp.delta_offset)
+            records = np.frombuffer(f.read(count * dtype.itemsize), dtype=dtype)
+        latest = {}
+        for i, (op, id) in enumerate(zip(records["op"].tolist(), records["id"].tolist())):
+            latest[id] = i if op == DELTA_ADD else None
+        ttp.remove([id for id, i in latest.items() if i is None])
+        added = {id: i for id, i in latest.items() if i is not None}
+        if added:
+            rows = dict(rows or {})
+            rows.update(load_ttp_rows_by_ids([id for id in added if id not in rows]))
+            found = [id for id in added if id in rows]
+            if found:
+                vectors = np.ascontiguousarray(records["vector"][[added[id] for id in found]])
+                ttp.add([rows[id] for id in found], vectors)
+        ttp.delta_offset += count * dtype.itemsize
+        return count
+
+    def load_ttp_index(self):
+        """Đọc index (file chính + delta) rồi đồng bộ với ttp_table (chỉ encode các TTP còn thiếu).
+
+        Index cũ dạng IndexFlatIP theo vị trí dòng không map được về id nên được build lại
+        một lần; chưa có file thì bắt đầu từ index rỗng. Khi phải sửa index thì checkpoint
+        dưới khóa exclusive (đọc lại file để không mất delta worker khác vừa ghi).
+        """
+        start = time.perf_counter()
+        rows = {row["id"]: row for row in load_ttp_rows()}
+        with self.ttp_file_lock(exclusive=False):
+            loaded = self._read_ttp_files(rows)
+        if loaded is None or loaded[1] or any(id not in loaded[0].rows for id in rows):
+            with self.ttp_file_lock(exclusive=True):
+                loaded = self._read_ttp_files(rows)
+                ttp, stale = loaded or (TtpVectorIndex.empty(self.get_model().get_sentence_embedding_dimension()), 0)
+                missing = [row for id, row in rows.items() if id not in ttp.rows]
+                if missing:
+                    ttp.add(missing, self.encode([ttp_document(row) for row in missing]))
+                if stale or missing or loaded is None:
+                    print(f"Đồng bộ index TTP: thêm {len(missing)}, xóa {stale}")
+                    self.checkpoint_ttp_index(ttp)
+        else:
+            ttp = loaded[0]
+        self.load_times["ttp_index_seconds"] = round(time.perf_counter() - start, 3)
+        self.swap_ttp_index(ttp)
+
+    def swap_ttp_index(self, ttp):
+        """Thay index TTP đang dùng bằng index mới (gán tham chiếu nguyên tử)"""
+        with self.lock:
+            self._ttp = ttp
+            self.swaps += 1
+
+    def persist_ttp_index(self, ttp):
+        """Ghi index ra file tạm, fsync rồi os.replace để crash giữa chừng không làm hỏng file"""
+        import faiss
+        dir_path = os.path.dirname(self.ttp_index_path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        tmp_path = f"{self.ttp_index_path}.{os.getpid()}.tmp"
+        with ttp.lock:
+            faiss.write_index(ttp.index, tmp_path)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.ttp_index_path)
+        fsync_dir(self.ttp_index_path)
+        ttp.mtime = self._file_mtime()
+
+    def checkpoint_ttp_index(self, ttp):
+        """Ghi toàn bộ index ra file chính rồi xóa rỗng file delta (giữ ttp_file_lock exclusive).
+
+        Crash giữa hai bước chỉ làm delta được áp dụng lại lần sau; áp dụng lại không đổi kết quả.
+        """
+        self.persist_ttp_index(ttp)
+        with open(self.ttp_delta_path, "wb") as f:
+            os.fsync(f.fileno())
+        ttp.delta_offset = 0
+        self.checkpoints += 1
+
+    def log_ttp_change(self, ttp, op, ids, embeddings=None):
+        """Ghi thay đổi (đã áp dụng vào ttp) vào cuối file delta, chi phí theo số TTP thay đổi;
+        delta đủ lớn thì checkpoint. Gọi khi giữ ttp_file_lock exclusive và ttp đã bắt kịp file."""
+        dtype = delta_dtype(ttp.index.d)
+        if ttp.delta_offset // dtype.itemsize + len(ids) >= TTP_INDEX_CHECKPOINT:
+            self.checkpoint_ttp_index(ttp)
+            return
+        records = np.zeros(len(ids), dtype=dtype)
+        records["op"] = op
+        records["id"] = ids
+        if embeddings is not None:
+            records["vector"] = embeddings
+        with open(self.ttp_delta_path, "ab") as f:
+            if f.tell() != ttp.delta_offset:
+                f.truncate(ttp.delta_offset)  # Bỏ bản ghi ghi dở do crash
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+            ttp.delta_offset = f.tell()
+
+    def add_ttps(self, rows):
+        """Encode và thêm các TTP mới vào index (bỏ qua TTP đã có)"""
+        with self.lock:
+            ttp = self.get_ttp_index()
+            rows = [row for row in rows if row["id"] not in ttp.rows]
+            if not rows:
+                return 0
+            embeddings = self.encode([ttp_document(row) for row in rows])
+            with self.ttp_file_lock(exclusive=True):
+                ttp = self.refresh_ttp_index(ttp)
+                ttp.add(rows, embeddings)
+                self.log_ttp_change(ttp, DELTA_ADD, [row["id"] for row in rows], embeddings)
+            return len(rows)
+
+    def remove_ttps(self, ids):
+        with self.lock:
+            ttp = self.get_ttp_index()
+            with self.ttp_file_lock(exclusive=True):
+                ttp = self.refresh_ttp_index(ttp)
+                ids = [id for id in ids if id in ttp.rows]
+                removed = ttp.remove(ids)
+                if removed:
+                    self.log_ttp_change(ttp, DELTA_REMOVE, ids)
+            return removed
+
+    def rebuild_ttp_index(self):
+        """Encode lại toàn bộ ttp_table (dùng khi đổi model)"""
+        with self.lock:
+            rows = load_ttp_rows()
+            ttp = TtpVectorIndex.empty(self.get_model().get_sentence_embedding_dimension())
+            if rows:
+                ttp.add(rows, self.encode([ttp_document(row) for row in rows]))
+            with self.ttp_file_lock(exclusive=True):
+                self.checkpoint_ttp_index(ttp)
+            self.swap_ttp_index(ttp)
+            return ttp
+
+    def warmup(self):
+        """Load model, chạy thử một lần encode và load index TTP trước khi nhận request"""
+        start = time.perf_counter()
+        self.encode(["khởi động"])
+        self.get_ttp_index().search(self.encode(["khởi động"]), 1)
+        self.load_times["warmup_seconds"] = round(time.perf_counter() - start, 3)
+        self.warmed_up = True
+
+    def stats(self):
+        model = self._model
+        ttp = self._ttp
+        model_mb = None
+        if model is not None:
+            model_mb = model_memory_mb(model)
+        return {
+            "model_name": self.model_name,
+            "embedding_backend": self.backend,
+            "model_loaded": model is not None,
+            "model_memory_mb": model_mb,
+            "ttp_index_path": self.ttp_index_path,
+            "ttp_index_loaded": ttp is not None,
+            "ttp_vectors": ttp.index.ntotal if ttp else 0,
+            "ttp_index_memory_mb": ttp.size_mb if ttp else 0,
+            "ttp_index_swaps": self.swaps,
+            "ttp_delta_records": ttp.delta_offset // delta_dtype(ttp.index.d).itemsize if ttp else 0,
+            "ttp_index_checkpoints": self.checkpoints,
+            "load_times": dict(self.load_times),
+            "embedding_cache": self.get_cache().stats() if self.get_cache() else None,
+            "warmed_up": self.warmed_up,
+            "process_rss_mb": process_rss_mb(),
+        }
+
+registry = ModelRegistry()
@@ -0,0 +1,211 @@
+import os
+import hashlib
+import threading
+import numpy as np
+from sqlalchemy import text
+from dotenv import load_dotenv
+from Database.model_registry import registry
+
+load_dotenv()
+
+NEWS_VECTORDB_PATH = os.getenv("NEWS_VECTORDB_PATH", "faiss_news.index")
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+# Khi số vector đã xóa (tombstone) vượt tỉ lệ này thì build lại index
+REBUILD_RATIO = 0.2
+
+def get_model():
+    """Model embedding dùng chung (registry của process)"""
+    return registry.get_model()
+
+def vector_id(news_id):
+    """Chuyển news_id (chuỗi) thành id int64 ổn định cho FAISS"""
+    digest = hashlib.blake2b(str(news_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & 0x7FFFFFFFFFFFFFFF
+
+def news_document(title, content):
+    """Văn bản dùng để embed một bài báo"""
+    return f"{title or ''}. {content or ''}".strip()
+
+def encode_news(documents):
+    return registry.encode(documents)
+
+def hnsw_index(dim):
+    import faiss
+    index = faiss.IndexIDMap2(faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT))
+    faiss.downcast_index(index.index).hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
+class NewsVectorIndex:
+    """FAISS HNSW index (inner product trên vector chuẩn hóa) cho các bài báo.
+
+    HNSW không hỗ trợ xóa vector nên bài bị xóa được đánh dấu tombstone và lọc khi tìm kiếm;
+    khi tombstone nhiều thì build lại. Thêm lại một bài đã có vector (ví dụ xóa rồi thêm lại
+    cùng id) thì graph được build lại từ vector đang lưu để vector cũ không còn được trả về.
+    File index chỉ là cache: news_table là nguồn chuẩn,
+    lúc load index được đồng bộ lại (thêm bài còn thiếu, đánh dấu bài đã xóa).
+    """
+
+    def __init__(self, index, id_map):
+        import faiss
+        self.index = index
+        faiss.downcast_index(self.index.index).hnsw.efSearch = HNSW_EF_SEARCH
+        self.id_map = id_map   # vector_id -> news_id
+        self.deleted = set()   # vector_id đã xóa nhưng còn trong HNSW
+        self.version = None    # version corpus lúc đồng bộ gần nhất (Database.search_engine.sync_index)
+        self.applied = 0
+        self.dirty = False     # có thay đổi chưa ghi ra file
+        self.lock = threading.RLock()
+
+    @classmethod
+    def empty(cls, dim):
+        return cls(hnsw_index(dim), {})
+
+    def news_ids(self):
+        return set(self.id_map.values())
+
+    def add_rows(self, rows):
+        """Encode và thêm các dòng (id, title, content, ...) của news_table theo batch"""
+        for start in range(0, len(rows), 256):
+            batch = rows[start:start + 256]
+            self.add([row[0] for row in batch], [news_document(row[1], row[2]) for row in batch])
+
+    def add(self, news_ids, documents):
+        if not news_ids:
+            return
+        embeddings = encode_news(documents)
+        ids = np.array([vector_id(news_id) for news_id in news_ids], dtype="int64")
+        with self.lock:
+            self.applied += len(news_ids)
+            self.dirty = True
+            # Bài đã có vector (kể cả tombstone) thì vector cũ vẫn nằm trong graph: bỏ nó trước khi thêm
+            replaced = {vid for vid in ids.tolist() if vid in self.id_map or vid in self.deleted}
+            if replaced:
+                self.compact(replaced)
+            for news_id, vid in zip(news_ids, ids.tolist()):
+                self.id_map[vid] = news_id
+            self.index.add_with_ids(embeddings, ids)
+
+    def compact(self, drop=()):
+        """Build lại graph HNSW từ các vector đang lưu (không encode lại), bỏ tombstone và vector của drop"""
+        import faiss
+        with self.lock:
+            stored = faiss.vector_to_array(self.index.id_map)
+            keep, seen = [], set()
+            for i in range(len(stored) - 1, -1, -1):  # Id bị trùng thì giữ vector thêm sau cùng
+                vid = int(stored[i])
+                if vid in self.id_map and vid not in self.deleted and vid not in drop and vid not in seen:
+                    seen.add(vid)
+                    keep.append(i)
+            keep.reverse()
+            index = hnsw_index(self.index.d)
+            if keep:
+                vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+                index.add_with_ids(vectors[keep], stored[keep])
+            self.index = index
+            for vid in drop:
+                self.id_map.pop(vid, None)
+            self.deleted = set()
+            self.dirty = True
+
+    def remove(self, news_id):
+        vid = vector_id(news_id)
+        with self.lock:
+            self.applied += 1
+            if self.id_map.pop(vid, None) is not None:
+                self.deleted.add(vid)
+                self.dirty = True
+
+    @property
+    def needs_rebuild(self):
+        return len(self.deleted) > REBUILD_RATIO * max(self.index.ntotal, 1)
+
+    def search(self, query, top_k=10):
+        """Trả về [(news_id, similarity)] gần query nhất"""
+        if self.index.ntotal == 0:
+            return []
+        query_emb = encode_news([query])
+        with self.lock:
+            k = min(top_k + len(self.deleted), self.index.ntotal)
+            D, I = self.index.search(query_emb, k)
+            hits = []
+            seen = set()
+            for score, vid in zip(D[0], I[0]):
+                if vid < 0 or vid in seen or vid in self.deleted or vid not in self.id_map:
+                    continue
+                seen.add(vid)
+                hits.append((self.id_map[vid], float(score)))
+                if len(hits) == top_k:
+                    break
+        return hits
+
+    def save(self, path=NEWS_VECTORDB_PATH):
+        import faiss
+        dir_path = os.path.dirname(path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with self.lock:
+            faiss.write_index(self.index, tmp_path)
+            self.dirty = False
+        os.replace(tmp_path, path)
+
+_news_index = None
+_news_index_lock = threading.Lock()
+
+def load_news_index(engine, path=NEWS_VECTORDB_PATH):
+    """Load index từ file (nếu có) rồi đồng bộ với news_table, chỉ encode bài còn thiếu"""
+    import faiss
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, title, content FROM news_table")).fetchall()
+    by_vid = {vector_id(row[0]): row for row in rows}
+
+    dim = get_model().get_sentence_embedding_dimension()
+    vector_index = None
+    if os.path.exists(path):
+        index = faiss.read_index(path)
+        if index.d == dim and hasattr(index, "id_map"):
+            stored = faiss.vector_to_array(index.id_map).tolist()
+            vector_index = NewsVectorIndex(index, {vid: by_vid[vid][0] for vid in stored if vid in by_vid})
+            vector_index.deleted = {vid for vid in stored if vid not in by_vid}
+    if vector_index is None or vector_index.needs_rebuild:
+        vector_index = NewsVectorIndex.empty(dim)
+
+    missing = [row for vid, row in by_vid.items() if vid not in vector_index.id_map]
+    vector_index.add_rows(missing)
+    if missing or not os.path.exists(path):
+        vector_index.save(path)
+    return vector_index
+
+def get_news_index(engine):
+    """Lấy FAISS index tin tức dùng chung của process"""
+    global _news_index
+    if _news_index is None or _news_index.needs_rebuild:
+        with _news_index_lock:
+            if _news_index is None or _news_index.needs_rebuild:
+                if _news_index is not None and os.path.exists(NEWS_VECTORDB_PATH):
+                    os.remove(NEWS_VECTORDB_PATH)
+                _news_index = load_news_index(engine)
+    return _news_index
+
+def save_news_index(path=NEWS_VECTORDB_PATH):
+    """Ghi index ra file nếu có thay đổi (bài thêm/xóa dần) kể từ lần ghi trước, gọi khi tắt server"""
+    index = _news_index
+    if index is not None and index.dirty:
+        index.save(path)
+        return True
+    return False
+
+def reset_news_index():
+    global _news_index
+    with _news_index_lock:
+        _news_index = None
+
+def index_news_vectors(rows):
+    """Thêm vector của nhiều bài mới (news_id, title, content), encode theo một batch"""
+    if _news_index is not None and rows:
+        _news_index.add([row[0] for row in rows], [news_document(row[1], row[2]) for row in rows])
+
+def unindex_news_vector(news_id):
+    if _news_index is not None:
+        _news_index.remove(news_id)
@@ -0,0 +1,187 @@
+import os
+import json
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# torch: SentenceTransformer fp32 | onnx-int8: ONNX Runtime, trọng số int8 | torch-int8: PyTorch dynamic int8
+EMBEDDING_BACKENDS = ("torch", "onnx-int8", "torch-int8")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_models")
+# Giới hạn số token (batch x độ dài đã pad) của một batch khi encode
+MAX_TOKENS_PER_BATCH = int(os.getenv("EMBEDDING_MAX_TOKENS_PER_BATCH", "8192"))
+
+def normalize_backend(backend):
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND phải là một trong {EMBEDDING_BACKENDS}")
+    return backend
+
+def mean_pool(hidden, attention_mask):
+    mask = attention_mask[..., None].astype(np.float32)
+    return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+def length_batches(lengths, batch_size, max_tokens=MAX_TOKENS_PER_BATCH):
+    """Chia chỉ số câu (đã sắp theo độ dài giảm dần) thành batch sao cho batch x độ dài dài nhất
+    không vượt max_tokens; câu ngắn được gom thành batch lớn, câu dài thành batch nhỏ"""
+    order = np.argsort(-np.asarray(lengths), kind="stable")
+    batches, current = [], []
+    for i in order.tolist():
+        # Câu đầu batch là câu dài nhất nên độ dài pad của batch là lengths[current[0]]
+        longest = lengths[current[0]] if current else lengths[i]
+        if current and (len(current) >= batch_size or longest * (len(current) + 1) > max_tokens):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+class DynamicBatchEncoder:
+    """Encoder mean pooling với batch theo độ dài câu (pad tới câu dài nhất trong batch).
+
+    Lớp con cài đặt run(inputs) trả về last_hidden_state dạng numpy. Giao diện encode giống
+    SentenceTransformer để ModelRegistry dùng thay thế trực tiếp.
+    """
+
+    def __init__(self, tokenizer, max_seq_length, dim):
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def run(self, inputs):
+        raise NotImplementedError
+
+    def encode(self, texts, batch_size=64, normalize_embeddings=True, **kwargs):
+        texts = list(texts)
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if not texts:
+            return embeddings
+        lengths = [len(ids) for ids in self.tokenizer(texts, truncation=True, max_length=self.max_seq_length)["input_ids"]]
+        for batch in length_batches(lengths, batch_size):
+            inputs = self.tokenizer(
+                [texts[i] for i in batch], padding=True, truncation=True,
+                max_length=self.max_seq_length, return_tensors="np"
+            )
+            hidden = self.run(inputs)
+            embeddings[batch] = mean_pool(hidden, inputs["attention_mask"])
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+class TorchInt8Encoder(DynamicBatchEncoder):
+    """Transformer của SentenceTransformer với các lớp Linear lượng tử hóa động sang int8"""
+
+    def __init__(self, st_model):
+        import torch
+        transformer = st_model[0]
+        self.torch = torch
+        self.model = torch.ao.quantization.quantize_dynamic(
+            transformer.auto_model.cpu().eval(), {torch.nn.Linear}, dtype=torch.qint8
+        )
+        super().__init__(transformer.tokenizer, transformer.max_seq_length, st_model.get_sentence_embedding_dimension())
+
+    def run(self, inputs):
+        tensors = {name: self.torch.from_numpy(np.asarray(value)) for name, value in inputs.items()}
+        with self.torch.inference_mode():
+            return self.model(**tensors).last_hidden_state.float().numpy()
+
+class OnnxInt8Encoder(DynamicBatchEncoder):
+    """Model ONNX (trọng số int8) chạy bằng ONNX Runtime trên CPU"""
+
+    def __init__(self, model_dir):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        with open(os.path.join(model_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.model_path = os.path.join(model_dir, "model-int8.onnx")
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [item.name for item in self.session.get_inputs()]
+        super().__init__(AutoTokenizer.from_pretrained(model_dir), self.meta["max_seq_length"], self.meta["dim"])
+
+    def run(self, inputs):
+        feed = {name: np.asarray(inputs[name], dtype=np.int64) for name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+def onnx_model_dir(model_name, root=ONNX_MODEL_DIR):
+    return os.path.join(root, model_name.replace("/", "_"))
+
+def check_mean_pooling(st_model):
+    config = st_model[1].get_config_dict() if len(st_model) > 1 else {}
+    # sentence-transformers mới lưu pooling_mode, bản cũ lưu các cờ pooling_mode_*_tokens
+    mean = config.get("pooling_mode") == "mean" or (
+        config.get("pooling_mode_mean_tokens")
+        and not any(value for key, value in config.items() if key.startswith("pooling_mode_") and key != "pooling_mode_mean_tokens")
+    )
+    if not mean:
+        raise ValueError("Backend lượng tử hóa chỉ hỗ trợ model dùng mean pooling")
+
+def export_onnx_int8(st_model, model_name, root=ONNX_MODEL_DIR):
+    """Xuất transformer sang ONNX (trục batch/sequence động) rồi lượng tử hóa động trọng số int8"""
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    check_mean_pooling(st_model)
+    transformer = st_model[0]
+    model_dir = onnx_model_dir(model_name, root)
+    os.makedirs(model_dir, exist_ok=True)
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids).last_hidden_state
+
+    sample = transformer.tokenizer(["xin chào", "kiểm tra tin nhắn lừa đảo"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model-int8.onnx")
+    torch.onnx.export(
+        LastHiddenState(transformer.auto_model.cpu().eval()),
+        tuple(sample[name] for name in input_names),
+        fp32_path,
+        input_names=input_names,
+        output_names=["last_hidden_state"],
+        dynamic_axes=dynamic_axes,
+        opset_version=17,
+        dynamo=False,
+    )
+    quantize_dynamic(fp32_path, int8_path + ".tmp", weight_type=QuantType.QInt8)
+    os.replace(int8_path + ".tmp", int8_path)
+    os.remove(fp32_path)
+    transformer.tokenizer.save_pretrained(model_dir)
+    with open(os.path.join(model_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "dim": st_model.get_sentence_embedding_dimension(),
+            "max_seq_length": transformer.max_seq_length,
+        }, f)
+    print(f"Đã xuất model ONNX int8 tại: {model_dir}")
+    return model_dir
+
+def load_encoder(model_name, backend=None):
+    """Encoder theo backend; model ONNX được xuất một lần rồi dùng lại từ ONNX_MODEL_DIR"""
+    backend = normalize_backend(backend)
+    if backend == "onnx-int8":
+        model_dir = onnx_model_dir(model_name)
+        if not os.path.exists(os.path.join(model_dir, "model-int8.onnx")):
+            from sentence_transformers import SentenceTransformer
+            export_onnx_int8(SentenceTransformer(model_name, device="cpu"), model_name)
+        return OnnxInt8Encoder(model_dir)
+
+    from sentence_transformers import SentenceTransformer
+    st_model = SentenceTransformer(model_name, device="cpu" if backend == "torch-int8" else None)
+    if backend == "torch-int8":
+        check_mean_pooling(st_model)
+        return TorchInt8Encoder(st_model)
+    return st_model
@@ -1,16 +1,31 @@
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine
-from rank_bm25 import BM25Okapi
+from sqlalchemy import text
+from collections import defaultdict
+import heapq
+import math
+import threading
+import time
 import re
 import os
+from urllib.parse import urlparse
 from dotenv import load_dotenv
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from Database.news_vectors import get_news_index, reset_news_index, index_news_vectors, unindex_news_vector
+from Database.query_cache import query_cache
+from Database.storage import engine, run_write, chunked, in_params, normalize_date_filter
+from Database.inverted_index import MmapInvertedIndex, build_inverted_index, read_current_generation
 
 load_dotenv()
-DB_PATH = os.getenv("DB_PATH")
-engine = create_engine(f"sqlite:///{DB_PATH}")
+# Backend mặc định cho search_bm25: "memory" (chỉ mục BM25 trong process), "fts5" (SQLite FTS5)
+# hoặc "mmap" (chỉ mục đảo CSR trên đĩa, đọc bằng mmap)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "memory")
+SEARCH_BACKENDS = ("memory", "fts5", "mmap")
+# Chu kỳ (giây) kiểm tra news_table có bị worker khác thay đổi không để build lại chỉ mục mmap
+MMAP_REFRESH_SECONDS = float(os.getenv("MMAP_REFRESH_SECONDS", "60"))
+# Chế độ tìm kiếm mặc định: "lexical" (chỉ BM25) hoặc "hybrid" (BM25 + vector FAISS, gộp bằng RRF)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "lexical")
+SEARCH_MODES = ("lexical", "hybrid")
+RRF_K = 60
 
 def clean_text(text):
     """Chuẩn hóa văn bản"""
@@ -29,42 +44,718 @@ def load_data_from_db():
 
 def build_bm25_index(df):
     """Tạo chỉ mục BM25 từ dữ liệu đã xử lý"""
+    from rank_bm25 import BM25Okapi
     combined = df['clean_content'] + " " + df['clean_title']
     tokenized_corpus = [simple_tokenize(doc) for doc in combined]
     return BM25Okapi(tokenized_corpus)
 
-def search_bm25(query, top_k=10):
-    """Tìm kiếm bằng BM25"""
-    df = load_data_from_db()
-    if df.empty:
-        return []  # Nếu không có dữ liệu thì trả về rỗng
+def tokenize_news(title, content):
+    """Tokenize một bài báo giống cách build_bm25_index xử lý (content + title)"""
+    return simple_tokenize(clean_text(content) + " " + clean_text(title))
 
-    bm25 = build_bm25_index(df)
+def news_outlet(source):
+    """Tên miền của nguồn tin (cột source lưu link bài báo), ví dụ "vnexpress.net" """
+    source = (source or "").strip().lower()
+    if not source:
+        return ""
+    host = (urlparse(source).netloc or urlparse("//" + source).netloc).split(":")[0]
+    return host[4:] if host.startswith("www.") else host
 
+def news_day(date):
+    """Phần ngày "YYYY-MM-DD" của cột date (có thể kèm giờ), chuỗi rỗng nếu không hợp lệ"""
+    date = str(date or "")[:10]
+    return date if re.match(r"^\d{4}-\d{2}-\d{2}$", date) else ""
+
+def news_partition(date, source):
+    """Khóa partition của một bài báo: (tháng "YYYY-MM", tên miền nguồn)"""
+    return (news_day(date)[:7], news_outlet(source))
+
+def normalize_sources_filter(sources):
+    if not sources:
+        return None
+    return tuple(sorted({news_outlet(source) for source in sources if news_outlet(source)})) or None
+
+def outlet_matches(outlet, sources):
+    """"vnexpress" khớp với "vnexpress.net", "congan" khớp với "congan.com.vn"..."""
+    return any(
+        outlet == source or outlet.startswith(source + ".") or outlet.endswith("." + source)
+        for source in sources
+    )
+
+def news_matches_filters(date, source, since=None, until=None, sources=None):
+    day = news_day(date)
+    if (since or until) and not day:
+        return False
+    if since and day < since:
+        return False
+    if until and day > until:
+        return False
+    return not sources or outlet_matches(news_outlet(source), sources)
+
+class BM25Index:
+    """Chỉ mục đảo BM25 nằm trong bộ nhớ, cập nhật tăng dần theo từng bài báo.
+
+    Điểm của một truy vấn chỉ được tính trên posting list của các từ trong truy vấn,
+    nên chi phí không phụ thuộc vào kích thước corpus. IDF dùng dạng log(1 + ...)
+    (luôn dương) để không phải tính lại trung bình IDF toàn corpus mỗi lần thêm bài.
+
+    Posting list được chia partition theo (tháng, nguồn tin); thống kê df/avgdl vẫn tính
+    trên toàn corpus để điểm giữa các partition so sánh được. Khi có bộ lọc since/until/
+    sources, các partition nằm ngoài bộ lọc bị loại trước khi tính điểm.
+
+    version/applied dùng để phát hiện thay đổi từ process khác (xem sync_index).
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.partitions = defaultdict(lambda: defaultdict(dict))  # (tháng, nguồn) -> term -> {news_id: tf}
+        self.df = defaultdict(int)         # term -> số bài chứa term (toàn corpus)
+        self.doc_terms = {}                # news_id -> các term của bài (để xóa)
+        self.doc_len = {}                  # news_id -> số token
+        self.doc_partition = {}            # news_id -> khóa partition
+        self.doc_day = {}                  # news_id -> "YYYY-MM-DD"
+        self.total_len = 0
+        self.version = None    # version corpus lúc đồng bộ gần nhất
+        self.applied = 0       # số thay đổi đã áp dụng trong process kể từ đó
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def news_ids(self):
+        return self.doc_len
+
+    def add_rows(self, rows):
+        """Thêm các dòng (id, title, content, date, source) của news_table"""
+        for news_id, title, content, date, source in rows:
+            self.add(news_id, tokenize_news(title, content), date, source)
+
+    def add(self, news_id, tokens, date=None, source=None):
+        """Thêm (hoặc thay thế) một bài báo vào chỉ mục"""
+        with self.lock:
+            self.applied += 1
+            if news_id in self.doc_len:
+                self._remove(news_id)
+            tf = defaultdict(int)
+            for token in tokens:
+                tf[token] += 1
+            key = news_partition(date, source)
+            postings = self.partitions[key]
+            for term, freq in tf.items():
+                postings[term][news_id] = freq
+                self.df[term] += 1
+            self.doc_terms[news_id] = tuple(tf)
+            self.doc_len[news_id] = len(tokens)
+            self.doc_partition[news_id] = key
+            self.doc_day[news_id] = news_day(date)
+            self.total_len += len(tokens)
+
+    def remove(self, news_id):
+        """Xóa một bài báo khỏi chỉ mục, trả về False nếu không tồn tại"""
+        with self.lock:
+            self.applied += 1
+            return self._remove(news_id)
+
+    def _remove(self, news_id):
+        with self.lock:
+            if news_id not in self.doc_len:
+                return False
+            key = self.doc_partition.pop(news_id)
+            postings = self.partitions[key]
+            for term in self.doc_terms.pop(news_id):
+                posting = postings[term]
+                posting.pop(news_id, None)
+                if not posting:
+                    del postings[term]
+                self.df[term] -= 1
+                if not self.df[term]:
+                    del self.df[term]
+            if not postings:
+                del self.partitions[key]
+            self.doc_day.pop(news_id)
+            self.total_len -= self.doc_len.pop(news_id)
+            return True
+
+    def select_partitions(self, since=None, until=None, sources=None):
+        """Các partition có thể chứa bài thỏa bộ lọc; partition biên (tháng chứa since/until)
+        cần lọc thêm theo ngày của từng bài"""
+        selected = []
+        for key in self.partitions:
+            month, outlet = key
+            if (since or until) and not month:
+                continue
+            if since and month < since[:7]:
+                continue
+            if until and month > until[:7]:
+                continue
+            if sources and not outlet_matches(outlet, sources):
+                continue
+            boundary = bool(since and month == since[:7]) or bool(until and month == until[:7])
+            selected.append((self.partitions[key], boundary))
+        return selected
+
+    def search(self, tokens, top_k=10, since=None, until=None, sources=None):
+        """Trả về [(news_id, score)] của top_k bài có điểm BM25 cao nhất"""
+        with self.lock:
+            n_docs = len(self.doc_len)
+            if not n_docs or not tokens:
+                return []
+            avgdl = self.total_len / n_docs or 1.0
+            partitions = self.select_partitions(since, until, sources)
+            scores = defaultdict(float)
+            for term in tokens:
+                df = self.df.get(term)
+                if not df:
+                    continue
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for postings, boundary in partitions:
+                    posting = postings.get(term)
+                    if not posting:
+                        continue
+                    for news_id, freq in posting.items():
+                        if boundary and not news_matches_filters(self.doc_day[news_id], "", since, until):
+                            continue
+                        norm = self.k1 * (1 - self.b + self.b * self.doc_len[news_id] / avgdl)
+                        scores[news_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+class TfidfModel:
+    """TF-IDF fit trên toàn bộ corpus, cache ma trận doc-term dạng sparse theo news_id.
+
+    Bài mới được transform bằng vocabulary hiện có và nối thêm vào ma trận; khi số bài
+    thêm/xóa kể từ lần fit vượt quá refit_ratio thì model được đánh dấu cần fit lại.
+    """
+
+    def __init__(self, news_ids, documents, refit_ratio=0.2, version=None):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        self.vectorizer = TfidfVectorizer()
+        self.matrix = self.vectorizer.fit_transform(documents).tocsr()
+        self.rows = {news_id: i for i, news_id in enumerate(news_ids)}
+        self.fitted_size = len(news_ids)
+        self.refit_ratio = refit_ratio
+        self.changes = 0
+        self.pending = []
+        self.version = version
+        self.applied = 0
+        self.lock = threading.RLock()
+
+    @property
+    def stale(self):
+        return self.changes > self.refit_ratio * max(self.fitted_size, 1)
+
+    def news_ids(self):
+        return self.rows
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.add(row[0], tfidf_document(row[1], row[2]))
+
+    def _append(self, news_id, document):
+        self.rows[news_id] = self.matrix.shape[0] + len(self.pending)
+        self.pending.append(self.vectorizer.transform([document]))
+        self.changes += 1
+
+    def add(self, news_id, document):
+        """Thêm (hoặc thay thế) vector của một bài báo bằng vocabulary đã fit"""
+        with self.lock:
+            self._append(news_id, document)
+            self.applied += 1
+
+    def remove(self, news_id):
+        with self.lock:
+            self.applied += 1
+            if self.rows.pop(news_id, None) is not None:
+                self.changes += 1
+
+    def score(self, query, news_ids, documents):
+        """Cosine giữa query và các bài báo: một phép nhân sparse với các dòng đã cache"""
+        with self.lock:
+            for news_id, document in zip(news_ids, documents):
+                if news_id not in self.rows:
+                    self._append(news_id, document)
+            if self.pending:
+                from scipy import sparse
+                self.matrix = sparse.vstack([self.matrix] + self.pending, format="csr")
+                self.pending = []
+            submatrix = self.matrix[[self.rows[news_id] for news_id in news_ids]]
+            query_vector = self.vectorizer.transform([query])
+        # Các dòng TF-IDF đã chuẩn hóa L2 nên tích vô hướng chính là cosine
+        return (submatrix @ query_vector.T).toarray().ravel()
+
+_bm25_index = None
+_bm25_lock = threading.Lock()
+_tfidf_model = None
+_tfidf_lock = threading.Lock()
+_mmap_index = None
+_mmap_lock = threading.Lock()
+_mmap_rebuilding = threading.Event()
+_mmap_rebuild_lock = threading.Lock()
+_mmap_checked_at = 0.0
+_mmap_failed_at = None
+
+def corpus_changes(known_ids):
+    """Đọc trong cùng một snapshot: version corpus, các dòng news_table chưa có trong known_ids
+    và các id trong known_ids đã bị xóa khỏi news_table"""
+    ensure_news_triggers_once()
+    with engine.connect() as conn:
+        version = conn.execute(text("SELECT value FROM corpus_meta WHERE key = 'news_version'")).scalar()
+        if not known_ids:
+            rows = conn.execute(text("SELECT id, title, content, date, source FROM news_table")).fetchall()
+            return version, rows, []
+        ids = {row[0] for row in conn.execute(text("SELECT id FROM news_table"))}
+        rows = []
+        for chunk in chunked([news_id for news_id in ids if news_id not in known_ids]):
+            params, placeholders = in_params(chunk)
+            rows.extend(conn.execute(text(
+                f"SELECT id, title, content, date, source FROM news_table WHERE id IN ({placeholders})"
+            ), params))
+    return version, rows, [news_id for news_id in known_ids if news_id not in ids]
+
+def sync_index(index):
+    """Đồng bộ một chỉ mục trong process (BM25, TF-IDF, vector) với news_table.
+
+    index.version là version corpus lúc đồng bộ gần nhất, index.applied là số thay đổi process
+    này đã áp dụng kể từ đó; tổng khác corpus_meta nghĩa là worker khác đã ghi news_table. Khi
+    đó chỉ đọc lại danh sách id, thêm bài còn thiếu và bỏ bài đã bị xóa, không build lại từ đầu.
+    """
+    if index.version is not None and index.version + index.applied == get_corpus_version():
+        return False
+    with index.lock:
+        if index.version is not None and index.version + index.applied == get_corpus_version():
+            return False
+        version, rows, removed = corpus_changes(index.news_ids())
+        index.add_rows(rows)
+        for news_id in removed:
+            index.remove(news_id)
+        index.version, index.applied = version, 0
+    return True
+
+def get_bm25_index():
+    """Lấy chỉ mục BM25 dùng chung của process, tạo từ news_table ở lần gọi đầu tiên"""
+    global _bm25_index
+    if _bm25_index is None:
+        with _bm25_lock:
+            if _bm25_index is None:
+                index = BM25Index()
+                sync_index(index)
+                _bm25_index = index
+                return index
+    sync_index(_bm25_index)
+    return _bm25_index
+
+def get_tfidf_model():
+    """Lấy TF-IDF model dùng chung, fit lại từ news_table khi chưa có hoặc đã cũ"""
+    global _tfidf_model
+    if _tfidf_model is not None and not _tfidf_model.stale:
+        sync_index(_tfidf_model)
+    if _tfidf_model is None or _tfidf_model.stale:
+        with _tfidf_lock:
+            if _tfidf_model is None or _tfidf_model.stale:
+                version, rows, _ = corpus_changes(())
+                documents = [tfidf_document(row[1], row[2]) for row in rows]
+                if not any(documents):
+                    return None  # Corpus rỗng, chưa fit được
+                _tfidf_model = TfidfModel([row[0] for row in rows], documents, version=version)
+    return _tfidf_model
+
+def get_news_vectors():
+    """FAISS index tin tức dùng chung, đồng bộ với news_table khi worker khác đã thay đổi corpus"""
+    index = get_news_index(engine)
+    sync_index(index)
+    return index
+
+def build_news_inverted_index():
+    """Build lại chỉ mục đảo trên đĩa từ news_table và publish generation mới.
+
+    news_table chỉ được đọc khi build thật sự chạy (trong build_lock); worker khác vừa
+    publish generation cùng version thì bỏ qua.
+    """
+    version = get_corpus_version()
+
+    def docs():
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT id, title, content, date, source FROM news_table"))
+            for news_id, title, content, date, source in rows:
+                yield news_id, tokenize_news(title, content), news_day(date), news_outlet(source)
+    build_inverted_index(docs(), corpus_version=version)
+
+def _rebuild_mmap_index():
+    """Build generation mới ở background; lỗi thì giữ index cũ (vẫn tìm kiếm được), lần kiểm tra sau thử lại"""
+    global _mmap_index, _mmap_failed_at
+    try:
+        build_news_inverted_index()
+        with _mmap_lock:
+            new_index = MmapInvertedIndex()
+            if _mmap_index is not None:
+                new_index.carry_over(_mmap_index)
+            _mmap_index = new_index
+        _mmap_failed_at = None
+    except Exception as e:
+        _mmap_failed_at = time.monotonic()
+        print(f"[X] Build lại chỉ mục mmap thất bại: {e}")
+    finally:
+        _mmap_rebuilding.clear()
+
+def start_mmap_rebuild():
+    """Build lại ở background nếu chưa có lần build nào đang chạy; sau một lần lỗi thì chờ
+    MMAP_REFRESH_SECONDS mới thử lại"""
+    with _mmap_rebuild_lock:
+        if _mmap_rebuilding.is_set():
+            return
+        if _mmap_failed_at is not None and time.monotonic() - _mmap_failed_at < MMAP_REFRESH_SECONDS:
+            return
+        _mmap_rebuilding.set()
+    threading.Thread(target=_rebuild_mmap_index, daemon=True).start()
+
+def load_mmap_index():
+    """Load generation hiện tại, build trước nếu chưa có hoặc đã cũ so với corpus_meta"""
+    if read_current_generation() is None:
+        build_news_inverted_index()
+    index = MmapInvertedIndex()
+    if index.meta["corpus_version"] != get_corpus_version():
+        build_news_inverted_index()
+        index = MmapInvertedIndex()
+    return index
+
+def get_mmap_index():
+    """Lấy chỉ mục đảo mmap dùng chung của process (None nếu chưa load được).
+
+    Lần đầu: build nếu chưa có hoặc đã cũ so với corpus_meta. Sau đó: load lại khi worker
+    khác publish generation mới, và build lại ở background khi delta quá lớn hoặc
+    news_table bị thay đổi từ process khác. Load lỗi (generation hỏng) thì giữ index cũ,
+    hoặc trả về None để tìm bằng backend memory, và build lại ở background.
+    """
+    global _mmap_index, _mmap_checked_at
+    if _mmap_index is None:
+        if _mmap_rebuilding.is_set() or _mmap_failed_at is not None:
+            # Lần load đầu đã lỗi: chờ build ở background (có giới hạn tần suất thử lại)
+            start_mmap_rebuild()
+            return _mmap_index
+        with _mmap_lock:
+            if _mmap_index is None:
+                try:
+                    _mmap_index = load_mmap_index()
+                    _mmap_checked_at = time.monotonic()
+                except Exception as e:
+                    print(f"[X] Load chỉ mục mmap thất bại, tạm dùng backend memory: {e}")
+                    start_mmap_rebuild()
+        return _mmap_index
+
+    index = _mmap_index
+    if time.monotonic() - _mmap_checked_at > MMAP_REFRESH_SECONDS and not _mmap_rebuilding.is_set():
+        _mmap_checked_at = time.monotonic()
+        generation = read_current_generation()
+        if generation and generation != index.generation:
+            with _mmap_lock:
+                try:
+                    new_index = MmapInvertedIndex()
+                except Exception as e:
+                    print(f"[X] Load generation {generation} thất bại, giữ generation {index.generation}: {e}")
+                    start_mmap_rebuild()
+                else:
+                    new_index.carry_over(index)
+                    _mmap_index = new_index
+        elif index.meta["corpus_version"] + index.applied != get_corpus_version():
+            # Mỗi chu kỳ kiểm tra build lại tối đa một lần; _mmap_rebuilding chặn build chồng nhau
+            start_mmap_rebuild()
+    if index.needs_rebuild:
+        start_mmap_rebuild()
+    return _mmap_index
+
+def tfidf_document(title, content):
+    """Văn bản dùng cho TF-IDF của một bài báo"""
+    return clean_text((title or "") + " " + (content or ""))
+
+def reset_search_index():
+    """Bỏ chỉ mục hiện tại, lần tìm kiếm sau sẽ tạo lại từ database"""
+    global _bm25_index, _tfidf_model, _mmap_index
+    with _bm25_lock:
+        _bm25_index = None
+    with _tfidf_lock:
+        _tfidf_model = None
+    with _mmap_lock:
+        _mmap_index = None
+    reset_news_index()
+
+def index_news(news_id, title, content, date=None, source=None):
+    """Cập nhật chỉ mục khi có bài báo mới được lưu"""
+    index_news_batch([(news_id, title, content, date, source)])
+
+def index_news_batch(rows):
+    """Cập nhật chỉ mục cho nhiều bài mới (news_id, title, content, date, source)"""
+    for news_id, title, content, date, source in rows:
+        if _bm25_index is not None:
+            _bm25_index.add(news_id, tokenize_news(title, content), date, source)
+        if _tfidf_model is not None:
+            _tfidf_model.add(news_id, tfidf_document(title, content))
+        if _mmap_index is not None:
+            _mmap_index.add(news_id, tokenize_news(title, content), news_day(date), news_outlet(source))
+    index_news_vectors([row[:3] for row in rows])
+
+def unindex_news(news_id):
+    """Cập nhật chỉ mục khi một bài báo bị xóa"""
+    if _bm25_index is not None:
+        _bm25_index.remove(news_id)
+    if _tfidf_model is not None:
+        _tfidf_model.remove(news_id)
+    if _mmap_index is not None:
+        _mmap_index.remove(news_id)
+    unindex_news_vector(news_id)
+
+def fetch_news_by_ids(ids):
+    """Lấy các bài báo theo id, giữ nguyên thứ tự của danh sách ids"""
+    if not ids:
+        return []
+    params, placeholders = in_params(ids, prefix="id")
+    query = text(f"SELECT id, title, content, date, source FROM news_table WHERE id IN ({placeholders})")
+    with engine.connect() as conn:
+        rows = {row.id: row for row in conn.execute(query, params)}
+    return [
+        {"id": news_id, "title": rows[news_id].title or "", "content": rows[news_id].content or "",
+         "date": rows[news_id].date or "", "source": rows[news_id].source or ""}
+        for news_id in ids if news_id in rows
+    ]
+
+# Version của corpus, tăng mỗi khi news_table có thay đổi (dùng để vô hiệu hóa cache truy vấn)
+NEWS_VERSION_TRIGGERS = {
+    "news_version_ai": """
+        CREATE TRIGGER news_version_ai AFTER INSERT ON news_table BEGIN
+            UPDATE corpus_meta SET value = value + 1 WHERE key = 'news_version';
+        END""",
+    "news_version_ad": """
+        CREATE TRIGGER news_version_ad AFTER DELETE ON news_table BEGIN
+            UPDATE corpus_meta SET value = value + 1 WHERE key = 'news_version';
+        END""",
+    "news_version_au": """
+        CREATE TRIGGER news_version_au AFTER UPDATE ON news_table BEGIN
+            UPDATE corpus_meta SET value = value + 1 WHERE key = 'news_version';
+        END""",
+}
+
+NEWS_FTS_TRIGGERS = {
+    "news_fts_ai": """
+        CREATE TRIGGER news_fts_ai AFTER INSERT ON news_table BEGIN
+            INSERT INTO news_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+        END""",
+    "news_fts_ad": """
+        CREATE TRIGGER news_fts_ad AFTER DELETE ON news_table BEGIN
+            INSERT INTO news_fts(news_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+        END""",
+    "news_fts_au": """
+        CREATE TRIGGER news_fts_au AFTER UPDATE ON news_table BEGIN
+            INSERT INTO news_fts(news_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+            INSERT INTO news_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+        END""",
+}
+
+def ensure_news_triggers():
+    """Tạo bảng FTS5 news_fts (external content trỏ vào news_table), bảng corpus_meta
+    và các trigger đồng bộ.
+
+    Khi news_table bị tạo lại (to_sql với if_exists='replace') các trigger mất theo bảng,
+    lúc đó chỉ mục FTS được rebuild lại toàn bộ từ news_table và version corpus được tăng.
+    """
+    def write(conn):
+        conn.execute(text("CREATE TABLE IF NOT EXISTS corpus_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)"))
+        conn.execute(text("INSERT OR IGNORE INTO corpus_meta (key, value) VALUES ('news_version', 0)"))
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS news_fts USING fts5("
+            "title, content, content='news_table', content_rowid='rowid', "
+            "tokenize='unicode61 remove_diacritics 0')"
+        ))
+        existing = {
+            row[0] for row in conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'news_table'"
+            ))
+        }
+        missing = [name for name in NEWS_FTS_TRIGGERS if name not in existing]
+        for name in missing:
+            conn.execute(text(NEWS_FTS_TRIGGERS[name]))
+        if missing:
+            conn.execute(text("INSERT INTO news_fts(news_fts) VALUES ('rebuild')"))
+        missing = [name for name in NEWS_VERSION_TRIGGERS if name not in existing]
+        for name in missing:
+            conn.execute(text(NEWS_VERSION_TRIGGERS[name]))
+        if missing:
+            conn.execute(text("UPDATE corpus_meta SET value = value + 1 WHERE key = 'news_version'"))
+
+    run_write(write)
+
+_triggers_ready = False
+
+def ensure_news_triggers_once():
+    """Gọi ensure_news_triggers một lần cho mỗi process"""
+    global _triggers_ready
+    if not _triggers_ready:
+        ensure_news_triggers()
+        _triggers_ready = True
+
+def get_corpus_version():
+    """Version hiện tại của news_table (đọc từ corpus_meta, dùng chung giữa các worker)"""
+    ensure_news_triggers_once()
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT value FROM corpus_meta WHERE key = 'news_version'")).scalar()
+
+def search_fts5(tokenized_query, top_k=10, since=None, until=None, sources=None):
+    """Tìm kiếm ứng viên ngay trong SQLite bằng FTS5, xếp hạng theo bm25().
+
+    Bộ lọc ngày được đẩy xuống SQL; bộ lọc nguồn được lọc thô bằng LIKE trong SQL rồi
+    kiểm tra chính xác theo tên miền.
+    """
+    ensure_news_triggers_once()
+
+    match = " OR ".join('"' + token.replace('"', '""') + '"' for token in tokenized_query)
+    conditions = ["news_fts MATCH :match"]
+    params = {"match": match, "top_k": top_k}
+    if since:
+        conditions.append("substr(n.date, 1, 10) >= :since")
+        params["since"] = since
+    if until:
+        conditions.append("substr(n.date, 1, 10) <= :until")
+        params["until"] = until
+    if sources:
+        likes = []
+        for i, source in enumerate(sources):
+            params[f"source{i}"] = f"%{source}%"
+            likes.append(f"n.source LIKE :source{i}")
+        conditions.append("(" + " OR ".join(likes) + ")")
+    query = text(
+        "SELECT n.id, n.title, n.content, n.date, n.source "
+        "FROM news_fts JOIN news_table AS n ON n.rowid = news_fts.rowid "
+        f"WHERE {' AND '.join(conditions)} ORDER BY bm25(news_fts) LIMIT :top_k"
+    )
+    with engine.connect() as conn:
+        rows = conn.execute(query, params)
+        return [
+            {"id": row.id, "title": row.title or "", "content": row.content or "",
+             "date": row.date or "", "source": row.source or ""}
+            for row in rows
+            if not sources or outlet_matches(news_outlet(row.source), sources)
+        ]
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Gộp nhiều danh sách id đã xếp hạng bằng Reciprocal Rank Fusion"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, news_id in enumerate(ranking):
+            scores[news_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def search_lexical(tokenized_query, top_k, backend, since=None, until=None, sources=None):
+    if backend == "fts5":
+        return search_fts5(tokenized_query, top_k, since, until, sources)
+    mmap_index = get_mmap_index() if backend == "mmap" else None
+    if mmap_index is not None:
+        outlet_filter = (lambda outlet: outlet_matches(outlet, sources)) if sources else None
+        hits = mmap_index.search(tokenized_query, top_k, since, until, outlet_filter)
+        return fetch_news_by_ids([news_id for news_id, _ in hits])
+    # backend memory, hoặc mmap chưa load được
+    hits = get_bm25_index().search(tokenized_query, top_k, since, until, sources)
+    return fetch_news_by_ids([news_id for news_id, _ in hits])
+
+def search_bm25(query, top_k=10, backend=None, mode=None, since=None, until=None, sources=None):
+    """Tìm kiếm bằng BM25, backend là "memory", "fts5" hoặc "mmap" (mặc định lấy từ RETRIEVAL_BACKEND).
+
+    mode="hybrid" gộp thêm kết quả tìm kiếm vector (FAISS HNSW) bằng RRF.
+    since/until ("YYYY-MM-DD") và sources (tên miền hoặc tên báo, ví dụ "vnexpress")
+    giới hạn các bài được tìm.
+    """
+    backend = backend or RETRIEVAL_BACKEND
+    mode = mode or RETRIEVAL_MODE
+    since = normalize_date_filter(since)
+    until = normalize_date_filter(until)
+    sources = normalize_sources_filter(sources)
+    if backend not in SEARCH_BACKENDS:
+        raise ValueError(f"Backend không hợp lệ: {backend}. Chọn một trong {SEARCH_BACKENDS}")
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Mode không hợp lệ: {mode}. Chọn một trong {SEARCH_MODES}")
+
+    raw_query = query
     query = clean_text(query)
     tokenized_query = simple_tokenize(query)
     if not tokenized_query:
         return []  # Nếu query không hợp lệ
 
-    scores = bm25.get_scores(tokenized_query)
-    top_indices = np.argsort(scores)[::-1][:top_k]
+    if mode == "lexical":
+        return search_lexical(tokenized_query, top_k, backend, since, until, sources)
+
+    candidates = max(top_k * 2, 20)
+    lexical = search_lexical(tokenized_query, candidates, backend, since, until, sources)
+    filtered = bool(since or until or sources)
+    # Index vector không chia partition nên lấy dư ứng viên rồi lọc theo metadata
+    dense = get_news_vectors().search(raw_query, candidates * 4 if filtered else candidates)
+    dense_rows = fetch_news_by_ids([news_id for news_id, _ in dense])
+    if filtered:
+        dense_rows = [
+            row for row in dense_rows
+            if news_matches_filters(row["date"], row["source"], since, until, sources)
+        ][:candidates]
+    fused = reciprocal_rank_fusion([
+        [res["id"] for res in lexical],
+        [res["id"] for res in dense_rows],
+    ])[:top_k]
+    return fetch_news_by_ids(fused)
 
-    return df.iloc[top_indices][['title', 'content', 'date', 'source']].to_dict(orient='records')
+def warmup_search(backend=None):
+    """Import sklearn/scipy và tạo trước chỉ mục BM25 + TF-IDF để request đầu tiên không phải chờ"""
+    start = time.perf_counter()
+    backend = backend or RETRIEVAL_BACKEND
+    if backend == "memory":
+        get_bm25_index()
+    elif backend == "mmap":
+        get_mmap_index()
+    else:
+        ensure_news_triggers_once()
+    if get_tfidf_model() is None:
+        # Corpus rỗng: vẫn import trước các thư viện dùng khi rerank
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.metrics.pairwise import cosine_similarity
+    return round(time.perf_counter() - start, 3)
 
 def rerank_with_tfidf(results, query, top_rerank=3):
-    """Sắp xếp lại kết quả BM25 bằng TF-IDF"""
+    """Sắp xếp lại kết quả BM25 bằng TF-IDF fit trên toàn corpus"""
     query_text = clean_text(query)
 
     if not query_text or not results:
         return []
 
-    documents = [query_text] + [clean_text(res['title'] + " " + res['content']) for res in results]
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(documents)
-
-    cosine_scores = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:]).flatten()
+    model = get_tfidf_model()
+    if model is not None and all("id" in res for res in results):
+        cosine_scores = model.score(
+            query_text,
+            [res["id"] for res in results],
+            [tfidf_document(res["title"], res["content"]) for res in results],
+        )
+    else:
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.metrics.pairwise import cosine_similarity
+        documents = [query_text] + [clean_text(res['title'] + " " + res['content']) for res in results]
+        vectorizer = TfidfVectorizer()
+        tfidf_matrix = vectorizer.fit_transform(documents)
+        cosine_scores = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:]).flatten()
 
     for i, res in enumerate(results):
         res["score_tfidf"] = float(cosine_scores[i])
 
     return sorted(results, key=lambda x: x["score_tfidf"], reverse=True)[:top_rerank]
+
+def retrieve_news(query, top_k=10, top_rerank=3, backend=None, mode=None, since=None, until=None, sources=None):
+    """BM25 (hoặc hybrid) + rerank TF-IDF, có cache kết quả theo query đã chuẩn hóa"""
+    backend = backend or RETRIEVAL_BACKEND
+    mode = mode or RETRIEVAL_MODE
+    normalized = " ".join(simple_tokenize(clean_text(query)))
+    filters = (normalize_date_filter(since), normalize_date_filter(until), normalize_sources_filter(sources))
+    key = (normalized, top_k, top_rerank, backend, mode) + filters
+    version = get_corpus_version()
+
+    cached = query_cache.get(key, version)
+    if cached is not None:
+        return cached
+
+    results = rerank_with_tfidf(
+        search_bm25(query, top_k, backend=backend, mode=mode, since=since, until=until, sources=sources),
+        query, top_rerank,
+    )
+    query_cache.put(key, version, results)
+    return results
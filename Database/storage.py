@@ -0,0 +1,175 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from sqlalchemy import create_engine, event
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_PATH = os.getenv("DB_PATH", "news_database.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")   # NORMAL là đủ an toàn với WAL
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 2**20)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # số âm = KiB (64 MB)
+# Số job ghi tối đa được gộp vào một transaction của writer
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "64"))
+
+def make_engine(db_path=DB_PATH):
+    """Engine SQLite dùng chung: WAL, các pragma đã chỉnh và pool kết nối.
+
+    Transaction tự quản lý (BEGIN do SQLAlchemy phát ra) để SAVEPOINT hoạt động đúng;
+    kết nối có execution option immediate=True mở bằng BEGIN IMMEDIATE (dùng cho writer).
+    """
+    if db_path == ":memory:":
+        engine = create_engine("sqlite://")
+    else:
+        engine = create_engine(
+            f"sqlite:///{db_path}",
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000, "check_same_thread": False},
+        )
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None  # tắt BEGIN ngầm của sqlite3
+        cursor = dbapi_connection.cursor()
+        if db_path != ":memory:":
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def begin(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE" if conn.get_execution_options().get("immediate") else "BEGIN")
+
+    return engine
+
+engine = make_engine()
+
+class WriterQueue:
+    """Một thread ghi duy nhất cho mỗi process: các job ghi được xếp hàng và gộp vào một
+    transaction (BEGIN IMMEDIATE), mỗi job chạy trong SAVEPOINT riêng nên job lỗi chỉ
+    rollback phần của nó. Đọc dùng kết nối khác trong pool và không bị chặn nhờ WAL.
+    """
+
+    def __init__(self, engine, batch_size=WRITE_BATCH_SIZE):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.batches = 0
+        self.jobs_done = 0
+
+    def _ensure_thread(self):
+        # Tạo lại thread sau fork (thread không được sao chép sang process con)
+        if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+                    self.jobs = queue.Queue()
+                    self.pid = os.getpid()
+                    self.thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                    self.thread.start()
+
+    def submit(self, fn):
+        """Đưa job fn(conn) vào hàng đợi, trả về Future chứa kết quả (có sau khi commit)"""
+        future = Future()
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            # Gọi từ bên trong một job khác: chạy luôn trong transaction hiện tại
+            try:
+                with conn.begin_nested():
+                    future.set_result(fn(conn))
+            except BaseException as e:
+                future.set_exception(e)
+            return future
+        self._ensure_thread()
+        self.jobs.put((fn, future))
+        return future
+
+    def write(self, fn):
+        return self.submit(fn).result()
+
+    def _next_batch(self):
+        batch = [self.jobs.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.jobs.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            results = []
+            try:
+                with self.engine.connect() as conn:
+                    conn.execution_options(immediate=True)
+                    self.local.conn = conn
+                    try:
+                        with conn.begin():
+                            for fn, future in batch:
+                                try:
+                                    with conn.begin_nested():
+                                        results.append((future, fn(conn), None))
+                                except Exception as e:
+                                    results.append((future, None, e))
+                    finally:
+                        self.local.conn = None
+            except Exception as e:
+                # Commit thất bại: báo lỗi cho mọi job chưa lỗi trong batch
+                results = [(future, None, error or e) for future, _, error in results]
+                results += [(future, None, e) for _, future in batch[len(results):]]
+            self.batches += 1
+            self.jobs_done += len(batch)
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            "queued": self.jobs.qsize(),
+            "batches": self.batches,
+            "jobs": self.jobs_done,
+            "avg_batch_size": round(self.jobs_done / self.batches, 2) if self.batches else 0.0,
+        }
+
+writer = WriterQueue(engine)
+
+def run_write(fn):
+    """Chạy fn(conn) trong writer của process, trả về kết quả sau khi đã commit"""
+    return writer.write(fn)
+
+def chunked(items, size=500):
+    """Chia items thành các đoạn tối đa size phần tử (SQLite giới hạn số tham số mỗi câu lệnh)"""
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def in_params(values, prefix="v"):
+    """Tham số và placeholder cho mệnh đề IN: ({"v0": a, "v1": b}, ":v0, :v1")"""
+    params = {f"{prefix}{i}": value for i, value in enumerate(values)}
+    return params, ", ".join(f":{key}" for key in params)
+
+def normalize_date_filter(value):
+    """Chuẩn hóa bộ lọc since/until về "YYYY-MM-DD", báo lỗi nếu sai định dạng"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:10], "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"Ngày không hợp lệ: {value}. Định dạng đúng là YYYY-MM-DD")
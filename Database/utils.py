@@ -1,165 +1,406 @@
 import os
+import json
+import base64
+from contextlib import closing
 import pandas as pd
-from sqlalchemy import create_engine
-import random
-import faiss
-from sentence_transformers import SentenceTransformer
+from sqlalchemy import text
 from dotenv import load_dotenv
-import numpy as np
+from Database.storage import engine, run_write, chunked, in_params
+from Database.model_registry import registry
+from Database.ids import new_news_id, new_ttp_id
+from Database.migrations import migrate
+from Database.history_archive import update_archived_rating, query_archive
+from Database.search_engine import index_news, index_news_batch, unindex_news, reset_search_index, ensure_news_triggers
 
 # Load biến môi trường
 load_dotenv()
 
-# Lấy DB path từ .env
-DB_PATH = os.getenv("DB_PATH", "news_database.db")
-VECTORDB_PATH = os.getenv("VECTORDB_PATH", "faiss_ttp.index")
-engine = create_engine(f"sqlite:///{DB_PATH}")
+# Engine dùng chung (WAL, pool) và writer queue nằm trong Database/storage.py
+# Số dòng mỗi chunk (một transaction) khi import TTP từ file
+TTP_IMPORT_CHUNK_SIZE = int(os.getenv("TTP_IMPORT_CHUNK_SIZE", "5000"))
 
 def init_database():
-    news_df = pd.DataFrame(columns=["id", "title", "content", "date", "source"])
-    news_df.to_sql('news_table', con=engine, if_exists='replace', index=False)
-
-    ttp_df = pd.DataFrame(columns=["pattern", "category", "ttp", "source"]) 
-    ttp_df.to_sql('ttp_table', con=engine, if_exists='replace', index=False)
-
-    history_df = pd.DataFrame(columns=["id", "request", "response", "timestamp", "user_rating"])
-    history_df.to_sql('history_table', con=engine, if_exists='replace', index=False)
+    """Chuẩn bị database khi khởi động: áp dụng migration (giữ dữ liệu cũ), trigger và chỉ mục tìm kiếm"""
+    migrate()
+    ensure_news_triggers()
+    reset_search_index()
 
 def get_news_table():
-    return pd.read_sql_table('news_table', engine)
+    return pd.read_sql_table('news_table', engine).fillna('')
 
 def delete_NewsID(id):
-    news_df = pd.read_sql_table('news_table', engine)
+    """Xóa một bài báo theo id (qua khóa chính) và cập nhật các chỉ mục tìm kiếm"""
+    deleted = run_write(lambda conn: conn.execute(
+        text("DELETE FROM news_table WHERE id = :id"), {"id": id}
+    ).rowcount)
 
-    if id not in news_df["id"].values:
+    if not deleted:
         return {"error": "Mail ID không tồn tại"}
 
-    news_df = news_df[news_df["id"] != id]
-    news_df.to_sql('news_table', con=engine, if_exists='replace', index=False)
+    # FTS5 và corpus_meta được cập nhật bằng trigger, các chỉ mục trong process cập nhật ở đây
+    unindex_news(id)
 
     return {"message": f"Tin tức với ID: {id} đã được xóa"}
 
 def generate_unique_id():
-    existing_ids = set(pd.read_sql_table('news_table', con=engine)['id'])
-
-    while True:
-        new_id = f"ID{random.randint(10000000, 99999999)}"
-        if new_id not in existing_ids:
-            return new_id
+    """Id bài báo mới (snowflake, không cần đọc database)"""
+    return new_news_id()
 
 def save_news_table(title, content, date, source):
-    existing_data = pd.read_sql_table('news_table', engine)
-    if title in existing_data["title"].values:
-        return  # Nếu tồn tại, bỏ qua
-
+    """Lưu một bài báo, bỏ qua nếu trùng tiêu đề hoặc link (UNIQUE index)"""
     new_id = generate_unique_id()
-    news_df = pd.DataFrame([{
-        "id": new_id,
-        "title": title,
-        "content": content,
-        "date": date,
-        "source": source
-    }])
-
-    news_df.to_sql('news_table', con=engine, if_exists='append', index=False)
+    date = str(date) if date is not None else None
+    source = source or None  # Link rỗng lưu NULL để không vướng UNIQUE index
+    inserted = run_write(lambda conn: conn.execute(text(
+        "INSERT OR IGNORE INTO news_table (id, title, content, date, source) "
+        "VALUES (:id, :title, :content, :date, :source)"
+    ), {"id": new_id, "title": title, "content": content, "date": date, "source": source}).rowcount)
+    if inserted:
+        index_news(new_id, title, content, date, source)
+
+def existing_values(conn, column, values, table="news_table"):
+    """Các giá trị đã có trong table.column (tra cứu qua UNIQUE index, theo từng chunk)"""
+    found = set()
+    for chunk in chunked(values):
+        params, placeholders = in_params(chunk)
+        rows = conn.execute(text(f"SELECT {column} FROM {table} WHERE {column} IN ({placeholders})"), params)
+        found.update(row[0] for row in rows)
+    return found
+
+def save_news_batch(articles):
+    """Lưu nhiều bài báo trong một transaction.
+
+    articles là list dict có title, content, date, link. Bài trùng tiêu đề/link trong batch
+    hoặc đã có trong database bị bỏ qua. Trả về số bài đã thêm và số bài bỏ qua.
+    """
+    rows, titles, links = [], set(), set()
+    for article in articles:
+        title = article.get("title")
+        link = article.get("link") or None
+        if not title or title in titles or (link and link in links):
+            continue
+        titles.add(title)
+        if link:
+            links.add(link)
+        date = article.get("date")
+        rows.append({
+            "title": title,
+            "content": article.get("content"),
+            "date": str(date) if date is not None else None,
+            "source": link,
+        })
+
+    def write(conn):
+        known_titles = existing_values(conn, "title", titles)
+        known_links = existing_values(conn, "source", links)
+        new_rows = [row for row in rows if row["title"] not in known_titles and row["source"] not in known_links]
+        for row in new_rows:
+            row["id"] = generate_unique_id()
+        if not new_rows:
+            return []
+        result = conn.execute(text(
+            "INSERT OR IGNORE INTO news_table (id, title, content, date, source) "
+            "VALUES (:id, :title, :content, :date, :source)"
+        ), new_rows)
+        if result.rowcount != len(new_rows):
+            # Có bài bị ghi trùng bởi request khác giữa lúc kiểm tra và lúc insert
+            stored = existing_values(conn, "id", [row["id"] for row in new_rows])
+            new_rows = [row for row in new_rows if row["id"] in stored]
+        return new_rows
+
+    inserted = run_write(write) if rows else []
+    index_news_batch([(row["id"], row["title"], row["content"], row["date"], row["source"]) for row in inserted])
+    return {"inserted": len(inserted), "skipped": len(articles) - len(inserted)}
 
 def save_ttp_table(pattern, category, ttp, source):
-    existing_data = pd.read_sql_table('ttp_table', engine)
-    if pattern in existing_data["pattern"].values:
-        return  
-
-    if category in existing_data["category"].values:
-        return  
-    
-    ttp_df = pd.DataFrame([{
-        "pattern": pattern,
-        "category": category,
-        "ttp": ttp,
-        "source": source
-    }])
-    with engine.begin() as conn:
-        ttp_df.to_sql('ttp_table', con=conn, if_exists='append', index=False)
+    """Lưu một TTP, bỏ qua nếu pattern hoặc category đã tồn tại. Trả về id nếu đã thêm"""
+    # Category rỗng lưu NULL như insert_ttp_batch để không vướng UNIQUE index
+    row = {"id": new_ttp_id(), "pattern": pattern, "category": category or None, "ttp": ttp, "source": source}
+    inserted = run_write(lambda conn: conn.execute(text(
+        "INSERT OR IGNORE INTO ttp_table (id, pattern, category, ttp, source) "
+        "VALUES (:id, :pattern, :category, :ttp, :source)"
+    ), row).rowcount)
+    if not inserted:
+        return None
+    index_ttps([row])
+    return row["id"]
+
+def insert_ttp_batch(ttps):
+    """Thêm nhiều TTP trong một transaction, chưa cập nhật index vector.
+
+    TTP trùng pattern/category trong batch hoặc đã có trong database bị bỏ qua.
+    Trả về các dòng đã thêm (kèm id).
+    """
+    rows, patterns, categories = [], set(), set()
+    for ttp in ttps:
+        pattern = ttp.get("pattern")
+        category = ttp.get("category") or None  # Category rỗng lưu NULL để không vướng UNIQUE index
+        if not pattern or pattern in patterns or (category is not None and category in categories):
+            continue
+        patterns.add(pattern)
+        if category is not None:
+            categories.add(category)
+        rows.append({
+            "pattern": pattern,
+            "category": category,
+            "ttp": ttp.get("ttp"),
+            "source": ttp.get("source"),
+        })
+    if not rows:
+        return []
+
+    def write(conn):
+        known_patterns = existing_values(conn, "pattern", patterns, table="ttp_table")
+        known_categories = existing_values(conn, "category", categories, table="ttp_table")
+        new_rows = [row for row in rows if row["pattern"] not in known_patterns and row["category"] not in known_categories]
+        for row in new_rows:
+            row["id"] = new_ttp_id()
+        if not new_rows:
+            return []
+        result = conn.execute(text(
+            "INSERT OR IGNORE INTO ttp_table (id, pattern, category, ttp, source) "
+            "VALUES (:id, :pattern, :category, :ttp, :source)"
+        ), new_rows)
+        if result.rowcount != len(new_rows):
+            stored = existing_values(conn, "id", [row["id"] for row in new_rows], table="ttp_table")
+            new_rows = [row for row in new_rows if row["id"] in stored]
+        return new_rows
+
+    return run_write(write)
+
+def import_ttps(chunks):
+    """Import TTP theo từng chunk (mỗi chunk một transaction), cập nhật index vector một lần ở cuối.
+
+    Lỗi giữa chừng không rollback các chunk đã commit: các TTP đó vẫn được đưa vào index
+    và kết quả trả về số đã import kèm "error".
+    """
+    inserted, total = [], 0
+    try:
+        for chunk in chunks:
+            inserted.extend(insert_ttp_batch(chunk))
+            total += len(chunk)
+    except Exception as e:
+        print(f"[X] Import TTP dừng sau {len(inserted)} bản ghi: {e}")
+        return {"inserted": len(inserted), "skipped": total - len(inserted), "error": str(e)}
+    finally:
+        if inserted:
+            index_ttps(inserted)
+    return {"inserted": len(inserted), "skipped": total - len(inserted)}
+
+def detect_text_encoding(fileobj, candidates=("utf-8", "latin1"), block_size=1 << 20):
+    """Encoding đầu tiên giải mã được toàn bộ file (đọc theo block, không giữ cả file)"""
+    import codecs
+    for encoding in candidates:
+        fileobj.seek(0)
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            while True:
+                block = fileobj.read(block_size)
+                decoder.decode(block, final=not block)
+                if not block:
+                    break
+        except UnicodeDecodeError:
+            continue
+        finally:
+            fileobj.seek(0)
+        return encoding
+    raise ValueError("Không xác định được encoding của file")
+
+TTP_FILE_COLUMNS = ["pattern", "category", "ttp", "source"]
+
+def read_ttp_file(fileobj, filename, chunk_size=TTP_IMPORT_CHUNK_SIZE):
+    """Đọc file TTP (CSV/Excel) thành các chunk list dict; CSV được đọc dần theo chunk_size dòng.
+
+    Kiểm tra cột ngay khi mở file (ValueError nếu thiếu cột), trả về generator các chunk.
+    """
+    def normalize(df):
+        df.columns = df.columns.str.strip().str.lower()
+        missing = [column for column in TTP_FILE_COLUMNS if column not in df.columns]
+        if missing:
+            raise ValueError(f"File thiếu cột: {', '.join(missing)}")
+        return df[TTP_FILE_COLUMNS].fillna("").astype(str).apply(lambda column: column.str.strip())
+
+    if filename.endswith(".csv"):
+        reader = pd.read_csv(
+            fileobj, encoding=detect_text_encoding(fileobj), dtype=str,
+            keep_default_na=False, chunksize=chunk_size
+        )
+        first = normalize(next(reader, pd.DataFrame(columns=TTP_FILE_COLUMNS)))
+
+        def chunks():
+            yield first.to_dict(orient="records")
+            for df in reader:
+                yield normalize(df).to_dict(orient="records")
+        return chunks()
+
+    df = normalize(pd.read_excel(fileobj, dtype=str))
+
+    def excel_chunks():
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size].to_dict(orient="records")
+    return excel_chunks()
+
+def index_ttps(rows):
+    """Thêm TTP mới vào index vector; lỗi ở đây không mất dữ liệu vì index tự đồng bộ khi load"""
+    try:
+        registry.add_ttps(rows)
+    except Exception as e:
+        print(f"[X] Không cập nhật được index TTP: {e}")
+
+def delete_ttp(id):
+    """Xóa một TTP theo id (số nguyên hoặc chuỗi số như /get_ttps trả về) và gỡ vector tương ứng khỏi index"""
+    try:
+        id = int(id)
+    except (TypeError, ValueError):
+        return {"error": "TTP ID không tồn tại"}
+    deleted = run_write(lambda conn: conn.execute(
+        text("DELETE FROM ttp_table WHERE id = :id"), {"id": id}
+    ).rowcount)
+
+    if not deleted:
+        return {"error": "TTP ID không tồn tại"}
+
+    try:
+        registry.remove_ttps([id])
+    except Exception as e:
+        print(f"[X] Không cập nhật được index TTP: {e}")
+
+    return {"message": f"TTP với ID: {id} đã được xóa"}
 
 def save_history_table(id, request, response, date, user_rating=''):
-    history_df = pd.DataFrame([{
-        "id": id,
-        "request": request,
-        "response": response,
-        "timestamp": date,
-        "user_rating": user_rating
-    }])
-    history_df.to_sql('history_table', con=engine, if_exists='append', index=False)
+    run_write(lambda conn: conn.execute(text(
+        "INSERT INTO history_table (id, request, response, timestamp, user_rating) "
+        "VALUES (:id, :request, :response, :timestamp, :user_rating)"
+    ), {"id": id, "request": request, "response": response, "timestamp": date, "user_rating": user_rating}))
 
 def update_history(id, user_rating):
-    history_df = pd.read_sql_table('history_table', engine)
-    
-    if id not in history_df["id"].values:
-        return {"error": "Record with ID not found"}
+    updated = run_write(lambda conn: conn.execute(
+        text("UPDATE history_table SET user_rating = :user_rating WHERE id = :id"),
+        {"id": id, "user_rating": user_rating}
+    ).rowcount)
+
+    # Bản ghi cũ đã được lưu trữ ra file: đánh giá lưu trong chỉ mục history_archive
+    if not updated:
+        updated = update_archived_rating(id, user_rating)
 
-    history_df.loc[history_df["id"] == id, "user_rating"] = user_rating
-    history_df.to_sql('history_table', con=engine, if_exists='replace', index=False)
+    if not updated:
+        return {"error": "Record with ID not found"}
 
     return {"message": f"User rating for ID {id} updated to {user_rating}"}
 
 def get_history():
     return pd.read_sql_table('history_table', engine)
 
+PAGED_TABLES = {
+    "news_table": ("date", ["id", "title", "content", "date", "source"]),
+    "history_table": ("timestamp", ["id", "request", "response", "timestamp", "user_rating"]),
+}
+
+def encode_cursor(order_value, id):
+    return base64.urlsafe_b64encode(json.dumps([order_value, id]).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        order_value, id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Cursor không hợp lệ")
+    if not isinstance(id, str) or not (order_value is None or isinstance(order_value, str)):
+        raise ValueError("Cursor không hợp lệ")
+    return order_value, id
+
+def iter_table_rows(table, cursor=None, batch_size=500):
+    """Đọc lần lượt các dòng theo (cột thời gian DESC, id DESC), dòng không có thời gian ở cuối.
+
+    Dùng keyset trên index (cột thời gian, id) nên không phải sắp xếp cả bảng; nếu có
+    cursor thì bắt đầu ngay sau dòng mà cursor trỏ tới. Các dòng được lấy từ DB cursor
+    theo từng batch nên bộ nhớ không tăng theo kích thước bảng.
+    """
+    order_column, columns = PAGED_TABLES[table]
+    select = f"SELECT {', '.join(columns)} FROM {table}"
+    queries = []
+    if cursor is None:
+        queries.append((f"{select} WHERE {order_column} IS NOT NULL ORDER BY {order_column} DESC, id DESC", {}))
+        queries.append((f"{select} WHERE {order_column} IS NULL ORDER BY id DESC", {}))
+    else:
+        order_value, last_id = decode_cursor(cursor)
+        if order_value is not None:
+            queries.append((
+                f"{select} WHERE {order_column} IS NOT NULL AND ({order_column}, id) < (:order_value, :id) "
+                f"ORDER BY {order_column} DESC, id DESC",
+                {"order_value": order_value, "id": last_id},
+            ))
+            queries.append((f"{select} WHERE {order_column} IS NULL ORDER BY id DESC", {}))
+        else:
+            queries.append((f"{select} WHERE {order_column} IS NULL AND id < :id ORDER BY id DESC", {"id": last_id}))
+
+    with engine.connect() as conn:
+        for query, params in queries:
+            result = conn.execution_options(yield_per=batch_size).execute(text(query), params)
+            for row in result.mappings():
+                yield dict(row)
+
+def get_table_page(table, limit, cursor=None):
+    """Một trang keyset: tối đa limit dòng và cursor của trang kế tiếp (None nếu hết)"""
+    rows = []
+    with closing(iter_table_rows(table, cursor, batch_size=limit + 1)) as row_iter:
+        for row in row_iter:
+            rows.append(row)
+            if len(rows) > limit:
+                break
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        order_column = PAGED_TABLES[table][0]
+        next_cursor = encode_cursor(rows[-1][order_column], rows[-1]["id"])
+    return {"data": rows, "next_cursor": next_cursor}
+
+def get_archived_history_page(limit, cursor=None, since=None, until=None):
+    """Một trang history đã lưu trữ (mới nhất trước), lọc theo ngày qua chỉ mục history_archive"""
+    after = None
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        if after[0] is None:
+            raise ValueError("Cursor không hợp lệ")
+    rows = query_archive(limit + 1, since, until, after)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+    return {"data": rows, "next_cursor": next_cursor}
+
 def get_ttp_table():
     return pd.read_sql_table('ttp_table', engine)
 
-def generate_ttp_embeddings(output_path=VECTORDB_PATH):
-    # Load dữ liệu TTP từ DB
-    ttp_df = pd.read_sql_table('ttp_table', engine)
-    if ttp_df.empty:
-        print("Bảng ttp_table đang rỗng, không tạo được embeddings.")
-        return
-
-    # Chuẩn bị văn bản embedding: kết hợp pattern và category
-    texts = (ttp_df["pattern"].astype(str) + " - " + ttp_df["category"].astype(str)).tolist()
-
-    # Khởi tạo model embedding
-    model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
-    embeddings = model.encode(texts, normalize_embeddings=True)
-
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(np.array(embeddings).astype("float32"))
-
-    # Tạo folder nếu cần
-    dir_path = os.path.dirname(output_path)
-    if dir_path and not os.path.exists(dir_path):
-        os.makedirs(dir_path, exist_ok=True)
-
-    faiss.write_index(index, output_path)
-    print(f"FAISS index lưu tại: {output_path}")
+def generate_ttp_embeddings():
+    """Encode lại toàn bộ ttp_table. Không cần gọi sau khi thêm/xóa TTP (index được cập nhật dần)"""
+    ttp = registry.rebuild_ttp_index()
+    if not ttp.rows:
+        print("Bảng ttp_table đang rỗng, index TTP rỗng.")
+    print(f"FAISS index lưu tại: {registry.ttp_index_path}")
 
 def map_ttp_from_text(text, top_k=2, threshold=0.4):
-    # Đảm bảo file index tồn tại
-    if not os.path.exists(VECTORDB_PATH):
-        raise FileNotFoundError("Chưa có file FAISS index. Vui lòng chạy generate_ttp_embeddings trước.")
+    return map_ttp_batch([text], top_k, threshold)[0]
 
-    # Load FAISS index
-    index = faiss.read_index(VECTORDB_PATH)
+def map_ttp_batch(texts, top_k=2, threshold=0.4):
+    """Map nhiều văn bản sang TTP: encode theo batch và tìm kiếm một lần trên cả ma trận.
 
-    # Load patterns từ DB
-    ttp_df = pd.read_sql_table('ttp_table', engine)
-    if ttp_df.empty:
+    Văn bản trùng nhau chỉ được encode một lần. Trả về list kết quả theo đúng thứ tự texts.
+    """
+    # Index TTP (khóa theo ttp_table.id) được registry load một lần và cập nhật dần
+    ttp = registry.get_ttp_index()
+    if not ttp.rows:
         print("Bảng ttp_table rỗng, không thể map TTP")
-        return []
-
-    model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
-    input_emb = model.encode([text], normalize_embeddings=True).astype("float32")
-
-    D, I = index.search(input_emb, top_k)
-
-    results = []
-    for score, idx in zip(D[0], I[0]):
-        if score >= threshold and idx < len(ttp_df):
-            row = ttp_df.iloc[idx]
-            results.append({
-                "category": row["category"],
-                "ttp": row["ttp"],
-                "source": row["source"],
-                "similarity": round(float(score), 3)
-            })
-    return results
+        return [[] for _ in texts]
+
+    unique_texts = list(dict.fromkeys(texts))
+    embeddings = registry.encode(unique_texts)
+
+    matches = {}
+    for text, hits in zip(unique_texts, ttp.search(embeddings, top_k)):
+        matches[text] = [{
+            "category": row["category"],
+            "ttp": row["ttp"],
+            "source": row["source"],
+            "similarity": round(score, 3)
+        } for row, score in hits if score >= threshold]
+    return [list(matches[text]) for text in texts]
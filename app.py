@@ -1,51 +1,68 @@
 from fastapi import FastAPI, Query, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
 import pytz
 from datetime import datetime
 import sys
 import os
+import asyncio
 import shutil
-import random
 import json
+from itertools import islice
 import pandas as pd
 import numpy as np
 
 # Database và crawl functions
-from Database.utils import init_database, get_news_table, save_news_table, delete_NewsID, get_history, save_history_table, get_ttp_table, save_ttp_table, generate_ttp_embeddings, map_ttp_from_text, update_history
-from Database.search_engine import search_bm25, rerank_with_tfidf
-from CrawlNews.crawl_vnexpress import crawl_vnexpress
-from CrawlNews.crawl_congan import crawl_congan
-from CrawlNews.crawl_dantri import crawl_dantri
-from CrawlNews.crawl_thanhnien import crawl_thanhnien
-from CrawlNews.crawl_nhandan import crawl_nhandan
-from CrawlNews.crawl_cafef import crawl_cafef
-from CrawlNews.crawl_antv import crawl_antv
-from CrawlNews.crawl_vtv import crawl_vtv
-from CrewAI.tools.search_googleapi import search_google_api
+from Database.utils import init_database, get_news_table, save_news_table, save_news_batch, delete_NewsID, get_history, save_history_table, get_ttp_table, save_ttp_table, import_ttps, read_ttp_file, delete_ttp, generate_ttp_embeddings, map_ttp_from_text, map_ttp_batch, update_history, iter_table_rows, get_table_page, decode_cursor, get_archived_history_page
+from Database.search_engine import retrieve_news, warmup_search
+from Database.query_cache import query_cache
+from Database.ids import new_history_id
+from Database.model_registry import registry, MODEL_WARMUP
+from Database.storage import writer
+from Database.news_vectors import save_news_index
+from Database.crawl_state import record_crawled, crawl_state_stats
+from Database.history_archive import archive_history, compact_archive, get_archived_history, archive_stats, HISTORY_HOT_DAYS, HISTORY_ARCHIVE_INTERVAL
 # Thêm thư mục CrewAI vào sys.path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'CrewAI'))
-from CrewAI.pipeline import Pipeline
 
-def initialize_database_and_crawl():
-    init_database()
-    sources = {
-        "vnexpress": crawl_vnexpress,
-        "congan": crawl_congan,
-    }
-
-    for name, crawl_func in sources.items():
-        try:
-            articles = crawl_func()
-            for article in articles:
-                if all(k in article for k in ['title', 'content', 'date', 'link']):
-                    save_news_table(article['title'], article['content'], article['date'], article['link'])
-            print(f"[✓] Crawled and saved articles from {name}")
-        except Exception as e:
-            print(f"[X] Error crawling {name}: {e}")
-
-initialize_database_and_crawl()
+# Các module nặng (crawler, CrewAI/langchain, Google API) chỉ được import khi dùng lần đầu
+# để process khởi động nhanh; các worker không dùng tới thì không tốn bộ nhớ cho chúng.
+def get_pipeline_class():
+    from CrewAI.pipeline import Pipeline
+    return Pipeline
+
+def search_google_api(query):
+    from CrewAI.tools.search_googleapi import search_google_api
+    return search_google_api(query)
+
+# Crawl lần đầu chạy nền sau khi server đã sẵn sàng, 0 để tắt
+STARTUP_CRAWL = os.getenv("STARTUP_CRAWL", "1") != "0"
+
+def save_crawl_results(results):
+    """Lưu kết quả crawl_sources/crawl ({nguồn: bài hoặc Exception}), trả về tổng số bài thêm/bỏ qua"""
+    total = {"inserted": 0, "skipped": 0}
+    for name, articles in results.items():
+        if isinstance(articles, Exception):
+            print(f"[X] Error crawling {name}: {articles}")
+            continue
+        articles = [article for article in articles if all(k in article for k in ['title', 'content', 'date', 'link'])]
+        saved = save_news_batch(articles)
+        # Ghi nhận sau khi lưu để bài chưa lưu được vẫn được crawl lại lần sau
+        record_crawled(name, articles)
+        print(f"[✓] Crawled and saved articles from {name}: {saved}")
+        total["inserted"] += saved["inserted"]
+        total["skipped"] += saved["skipped"]
+    return total
+
+def import_ttp_file(fileobj, filename):
+    return import_ttps(read_ttp_file(fileobj, filename))
+
+def initial_crawl():
+    from CrawlNews.sources import crawl
+    # Các nguồn được crawl đồng thời qua một CrawlEngine dùng chung
+    save_crawl_results(crawl(["vnexpress", "congan"]))
 
 # 🏷️ Khai báo metadata cho Swagger
 tags_metadata = [
@@ -105,13 +122,88 @@ class TTPs(BaseModel):
     ttp: str = ""
     source: str = ""
 
+class TTPMappingRequest(BaseModel):
+    texts: List[str]
+    top_k: int = 2
+    threshold: float = 0.4
+
 class SourceNews(BaseModel):
     list_source: List[str]
+    incremental: bool = True   # bỏ qua bài đã crawl trước khi tải trang chi tiết
+    max_pages: Optional[int] = None   # mặc định CRAWL_MAX_PAGES
+    stop_early: Optional[bool] = None  # mặc định CRAWL_STOP_EARLY
 
 class RatingRequest(BaseModel):
     id: str = ""
     user_rating: str = ""
 
+@app.on_event("startup")
+def initialize_database():
+    # Migration không phá dữ liệu: dữ liệu cũ được giữ nguyên qua các lần khởi động
+    init_database()
+
+def warmup_models():
+    # Load model embedding, index TTP và chỉ mục tìm kiếm (sklearn, faiss...) một lần
+    try:
+        registry.warmup()
+    except Exception as e:
+        print(f"[X] Warmup model thất bại: {e}")
+    try:
+        print(f"[✓] Warmup tìm kiếm: {warmup_search()}s")
+    except Exception as e:
+        print(f"[X] Warmup tìm kiếm thất bại: {e}")
+
+@app.on_event("shutdown")
+def persist_news_index():
+    # Index vector tin tức được thêm/xóa dần trong lúc chạy, ghi lại để lần khởi động sau không phải đồng bộ từ đầu
+    try:
+        if save_news_index():
+            print("[✓] Đã ghi index vector tin tức")
+    except Exception as e:
+        print(f"[X] Không ghi được index vector tin tức: {e}")
+
+background_tasks = set()
+
+@app.on_event("startup")
+async def schedule_warmup():
+    # Warmup tốn thời gian theo kích thước corpus nên chạy nền, server nhận request ngay;
+    # request đến trước khi warmup xong tự load phần nó cần (có khóa, không load hai lần)
+    if MODEL_WARMUP:
+        task = asyncio.create_task(asyncio.to_thread(warmup_models))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+@app.on_event("startup")
+async def schedule_initial_crawl():
+    # Không chặn startup: crawl chạy trong thread riêng, request được phục vụ ngay
+    if STARTUP_CRAWL:
+        task = asyncio.create_task(asyncio.to_thread(initial_crawl))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+def run_history_archive(hot_days=HISTORY_HOT_DAYS):
+    result = archive_history(hot_days)
+    result.update(compact_archive())
+    return result
+
+async def history_archive_loop():
+    while True:
+        try:
+            await asyncio.to_thread(run_history_archive)
+        except Exception as e:
+            print(f"[X] Lưu trữ history thất bại: {e}")
+        await asyncio.sleep(HISTORY_ARCHIVE_INTERVAL)
+
+@app.on_event("startup")
+async def schedule_history_archive():
+    # Giữ history_table nhỏ: định kỳ chuyển history cũ hơn HISTORY_HOT_DAYS ra file nén
+    if HISTORY_ARCHIVE_INTERVAL > 0:
+        task = asyncio.create_task(history_archive_loop())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+MAX_TTP_BATCH = 10000
+
 # ===================== ROUTES =====================
 
 @app.get("/", tags=["Info"])
@@ -126,6 +218,16 @@ async def add_news(request: News):
     save_news_table(request.title, request.content, date, request.link)
     return {"message": "News saved successfully!"}
 
+@app.post("/add_news_batch", tags=["Management"])
+async def add_news_batch(news_list: List[News]):
+    vietnam_tz = pytz.timezone('Asia/Ho_Chi_Minh')
+    now = datetime.now(vietnam_tz).strftime('%Y-%m-%d %H:%M:%S')
+    result = save_news_batch([
+        {"title": news.title, "content": news.content, "date": news.date or now, "link": news.link}
+        for news in news_list
+    ])
+    return {"message": f"Đã lưu {result['inserted']} tin tức, bỏ qua {result['skipped']} tin trùng.", **result}
+
 @app.post("/add_ttps", tags=["Management"])
 async def add_ttps(request: TTPs):
     save_ttp_table(request.pattern, request.category, request.ttp, request.source)
@@ -138,28 +240,19 @@ async def add_ttps_form_file(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="File phải là CSV hoặc Excel")
 
     try:
-        if filename.endswith(".csv"):
-            try:
-                df = pd.read_csv(file.file, encoding='utf-8')
-            except UnicodeDecodeError:
-                file.file.seek(0)  # reset con trỏ file
-                df = pd.read_csv(file.file, encoding='latin1') 
-        else:
-            df = pd.read_excel(file.file)
+        # Đọc file, insert và encode đều chặn lâu nên chạy trong thread, không giữ event loop
+        result = await asyncio.to_thread(import_ttp_file, file.file, filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Lỗi khi đọc file: {e}")
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=(
+            f"Lỗi khi import file: {result['error']} "
+            f"(đã import {result['inserted']} bản ghi, bỏ qua {result['skipped']} bản ghi trùng trước khi lỗi)"
+        ))
 
-    df.columns = df.columns.str.strip().str.lower()
-
-    for _, row in df.iterrows():
-        save_ttp_table(
-            pattern=str(row['pattern']),
-            category=str(row['category']),
-            ttp=str(row['ttp']),
-            source=str(row['source']),
-        )
-
-    return {"message": f"Import thành công {len(df)} bản ghi"}
+    return {"message": f"Import thành công {result['inserted']} bản ghi, bỏ qua {result['skipped']} bản ghi trùng", **result}
 
 @app.post("/generate_ttp_embeddings", tags=["Management"])
 async def api_generate_ttp_embeddings():
@@ -169,42 +262,49 @@ async def api_generate_ttp_embeddings():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi khi tạo FAISS index: {e}")
 
+@app.delete("/delete_ttp", tags=["Management"])
+async def api_delete_ttp(id: str):
+    # Id TTP là số nguyên 63 bit, API nhận/trả dạng chuỗi để client JavaScript không làm tròn
+    result = delete_ttp(id)
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return {"message": "TTP deleted successfully!"}
+
+@app.get("/model_registry_stats", tags=["Management"])
+async def model_registry_stats():
+    return registry.stats()
+
 @app.delete("/delete_news", tags=["Management"])
 async def delete_news(id: str):
-    delete_NewsID(id)
+    result = delete_NewsID(id)
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
     return {"message": "News deleted successfully!"}
 
 # === Crawl ===
 @app.post("/pipeline_crawl_news", tags=["Crawl"])
 async def pipeline_crawl_news(source_news: SourceNews):
-    list_source = source_news.list_source
-    total_saved = 0
-
-    for url in list_source:
-        if "dantri.com.vn" in url:
-            articles = crawl_dantri()
-        elif "vnexpress.net" in url:
-            articles = crawl_vnexpress()
-        elif "congan.com.vn" in url:
-            articles = crawl_congan()
-        elif "nhandan.vn" in url:
-            articles = crawl_nhandan()
-        elif "thanhnien.vn" in url:
-            articles = crawl_thanhnien()
-        elif "cafef.vn" in url:
-            articles = crawl_cafef()
-        elif "antv.gov.vn" in url:
-            articles = crawl_antv()
-        elif "vtv.vn" in url:
-            articles = crawl_vtv()
-        else:
-            continue
+    from CrawlNews.sources import crawl_sources, source_for_url
+    names = [source_for_url(url) for url in source_news.list_source]
+    results = await crawl_sources(
+        [name for name in names if name is not None],
+        incremental=source_news.incremental,
+        max_pages=source_news.max_pages,
+        stop_early=source_news.stop_early,
+    )
+    total = await asyncio.to_thread(save_crawl_results, results)
+    total_saved = total["inserted"]
+    total_skipped = total["skipped"]
 
-        for article in articles:
-            save_news_table(article['title'], article['content'], article['date'], article['link'])
-            total_saved += 1
+    return {
+        "message": f"Đã lưu thành công {total_saved} bài báo vào database!",
+        "inserted": total_saved,
+        "skipped": total_skipped
+    }
 
-    return {"message": f"Đã lưu thành công {total_saved} bài báo vào database!"}
+@app.get("/crawl_state_stats", tags=["Crawl"])
+async def crawl_stats():
+    return crawl_state_stats()
 
 @app.post("/verify_input", tags=["Requests"])
 async def verify_input(
@@ -221,7 +321,7 @@ async def verify_input(
             shutil.copyfileobj(input_image.file, f)
 
     # Gọi Pipeline để xử lý
-    verifier = Pipeline(text_input=input_text, image_path=image_path)
+    verifier = get_pipeline_class()(text_input=input_text, image_path=image_path)
     result = verifier.run()
 
     # Gộp request input
@@ -229,8 +329,8 @@ async def verify_input(
     if input_image:
         request_str += f" [IMAGE: {input_image.filename}]"
 
-    # Tạo ID mới theo định dạng "CAxxxxx"
-    id = f"CA{''.join([str(random.randint(0, 9)) for _ in range(5)])}"
+    # Tạo ID mới theo định dạng "CA<snowflake>"
+    id = new_history_id()
 
     # Lấy thời gian hiện tại theo múi giờ Việt Nam
     vietnam_tz = pytz.timezone('Asia/Ho_Chi_Minh')
@@ -259,11 +359,35 @@ async def verify_input(
         "ttp_matches": ttp_matches
     }
 
+@app.post("/map_ttps", tags=["Requests"])
+async def map_ttps(request: TTPMappingRequest):
+    if not request.texts:
+        return {"total": 0, "results": []}
+    if len(request.texts) > MAX_TTP_BATCH:
+        raise HTTPException(status_code=400, detail=f"Tối đa {MAX_TTP_BATCH} văn bản mỗi request")
+    if request.top_k < 1:
+        raise HTTPException(status_code=400, detail="top_k phải lớn hơn 0")
+    # Encode batch tốn CPU, chạy trong thread để các request khác không phải chờ
+    matches = await asyncio.to_thread(map_ttp_batch, request.texts, request.top_k, request.threshold)
+    return {
+        "total": len(request.texts),
+        "results": [{"text": text, "ttp_matches": ttp_matches} for text, ttp_matches in zip(request.texts, matches)]
+    }
+
 # === Retrieval (RAG) ===
 @app.get("/retrieval_news", tags=["Retrieval"])
-async def retrieval_news(query: str):
-    bm25_results = search_bm25(query)
-    final_results = rerank_with_tfidf(bm25_results, query)
+async def retrieval_news(
+    query: str,
+    backend: Optional[str] = None,
+    mode: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    sources: Optional[List[str]] = Query(None)
+):
+    try:
+        final_results = retrieve_news(query, backend=backend, mode=mode, since=since, until=until, sources=sources)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     for result in final_results:
         for key, value in result.items():
@@ -272,6 +396,10 @@ async def retrieval_news(query: str):
 
     return {"results": final_results}
 
+@app.get("/retrieval_cache_stats", tags=["Retrieval"])
+async def retrieval_cache_stats():
+    return query_cache.stats()
+
 @app.get("/search", tags=["Retrieval"])
 async def search(query: str):
     try:
@@ -284,8 +412,33 @@ async def search(query: str):
 
 # === Database Access ===
 
+def paged_table_response(table, limit, cursor, stream):
+    """Trả về một trang keyset hoặc stream NDJSON; None nếu dùng cách trả về cũ (cả bảng)"""
+    try:
+        if cursor is not None:
+            decode_cursor(cursor)
+        if stream:
+            rows = iter_table_rows(table, cursor)
+            if limit is not None:
+                rows = islice(rows, limit)
+            lines = (json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+        if limit is not None:
+            return get_table_page(table, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return None
+
 @app.get("/get_news", tags=["Database"])
-async def show_news():
+async def show_news(
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    stream: bool = False
+):
+    page = paged_table_response("news_table", limit, cursor, stream)
+    if page is not None:
+        return page
+
     news_df = get_news_table()
     news_df['date'] = pd.to_datetime(news_df['date'], errors='coerce')
     news_df = news_df.sort_values(by='date', ascending=False)
@@ -298,13 +451,23 @@ async def show_news():
 @app.get("/get_ttps", tags=["Database"])
 async def get_ttps():
     ttp_df = get_ttp_table()
+    # Id snowflake vượt 2^53, trả dạng chuỗi để client JavaScript không làm tròn
+    ttp_df["id"] = ttp_df["id"].astype(str)
     return {
         "total": len(ttp_df),
         "data": ttp_df.to_dict(orient="records")
     }
 
 @app.get("/get_history", tags=["Database"])
-async def show_history():
+async def show_history(
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    stream: bool = False
+):
+    page = paged_table_response("history_table", limit, cursor, stream)
+    if page is not None:
+        return page
+
     history_df = get_history()
     history_df['timestamp'] = pd.to_datetime(history_df['timestamp'], errors='coerce')
     history_df = history_df.sort_values(by='timestamp', ascending=False)
@@ -314,13 +477,46 @@ async def show_history():
         "data": history_df.to_dict(orient="records")
     }
 
+@app.get("/get_history_archive", tags=["Database"])
+async def show_history_archive(
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+):
+    try:
+        return get_archived_history_page(limit, cursor, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/get_archived_history", tags=["Database"])
+async def show_archived_history(id: str):
+    record = get_archived_history(id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Record with ID not found in archive")
+    return record
+
+@app.post("/archive_history", tags=["Management"])
+async def archive_history_now(hot_days: int = Query(HISTORY_HOT_DAYS, ge=0)):
+    return await asyncio.to_thread(run_history_archive, hot_days)
+
+@app.get("/history_archive_stats", tags=["Database"])
+async def history_archive_stats():
+    return archive_stats()
+
+@app.get("/storage_stats", tags=["Database"])
+async def storage_stats():
+    return writer.stats()
+
 @app.post("/rate_response", tags=["Database"])
 async def rate_response(rating: RatingRequest):
     try:
-        update_history(rating.id, rating.user_rating)
-        return {"message": f"Rating for response {rating.id} updated successfully."}
+        result = update_history(rating.id, rating.user_rating)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error updating rating: {str(e)}")
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return {"message": f"Rating for response {rating.id} updated successfully."}
     
 # ========== MAIN ==========
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+import os
+import sys
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pytest
+
+# Database/* đọc cấu hình lúc import, nên trỏ mọi file dữ liệu vào thư mục tạm trước khi import
+DATA_DIR = tempfile.mkdtemp(prefix="news_tests_")
+os.environ.update({
+    "DB_PATH": os.path.join(DATA_DIR, "news.db"),
+    "VECTORDB_PATH": os.path.join(DATA_DIR, "ttp.index"),
+    "NEWS_VECTORDB_PATH": os.path.join(DATA_DIR, "news.index"),
+    "INVERTED_INDEX_PATH": os.path.join(DATA_DIR, "news_inverted_index"),
+    "EMBEDDING_CACHE_SIZE": "0",
+    "MODEL_WARMUP": "0",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from Database.storage import engine
+from Database.utils import init_database
+from Database.model_registry import registry
+from Database import news_vectors
+
+
+class HashingEncoder:
+    """Encoder bag-of-words băm từ (không cần tải model): văn bản chung từ thì gần nhau"""
+
+    dim = 64
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def parameters(self):
+        return []
+
+    def encode(self, texts, batch_size=None, normalize_embeddings=True):
+        vectors = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text_ in enumerate(texts):
+            for word in text_.lower().split():
+                vectors[i, int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dim] += 1
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+@pytest.fixture
+def database():
+    """Database rỗng + index rỗng cho từng test, encoder giả thay cho model thật"""
+    init_database()
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM news_table"))
+        conn.execute(text("DELETE FROM ttp_table"))
+    for name in os.listdir(DATA_DIR):
+        if name.startswith(("ttp.index", "news.index", "news_inverted_index")):
+            path = os.path.join(DATA_DIR, name)
+            shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+    registry._model = HashingEncoder()
+    registry._ttp = None
+    news_vectors.reset_news_index()
+    init_database()
+    yield engine
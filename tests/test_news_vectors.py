@@ -0,0 +1,33 @@
+from sqlalchemy import text
+from Database.utils import save_news_table, delete_NewsID
+from Database.search_engine import get_news_vectors, search_bm25
+
+
+def insert_news(engine, news_id, title, content, source):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO news_table (id, title, content, date, source) VALUES (:id, :title, :content, '2025-03-01', :source)"
+        ), {"id": news_id, "title": title, "content": content, "source": source})
+
+
+def test_reinserted_article_uses_only_new_vector(database):
+    # Đủ nhiều bài để một tombstone không vượt REBUILD_RATIO (index không bị build lại toàn bộ)
+    for i, topic in enumerate(["giá vàng", "bóng đá", "thời tiết", "giáo dục", "y tế", "du lịch", "xe điện", "nông sản"]):
+        save_news_table(f"tin {topic}", f"cập nhật mới nhất về {topic}", "2025-03-01", f"https://a.vn/{i}")
+    insert_news(database, "news-1", "động đất sóng thần", "động đất mạnh gây sóng thần ven biển", "https://a.vn/news-1")
+    old_query = "động đất sóng thần ven biển"
+    assert get_news_vectors().search(old_query, 3)[0][0] == "news-1"
+
+    delete_NewsID("news-1")
+    insert_news(database, "news-1", "chứng khoán tăng điểm", "thị trường chứng khoán tăng điểm phiên sáng", "https://a.vn/news-1")
+
+    index = get_news_vectors()
+    old_hits = [score for news_id, score in index.search(old_query, 10) if news_id == "news-1"]
+    new_hits = [score for news_id, score in index.search("thị trường chứng khoán tăng điểm", 10) if news_id == "news-1"]
+    assert len(old_hits) == 1 and old_hits[0] < 0.5
+    assert len(new_hits) == 1 and new_hits[0] > 0.5
+    assert index.index.ntotal == 9
+
+    results = search_bm25("chứng khoán tăng điểm", top_k=1, backend="memory", mode="hybrid")
+    assert [row["id"] for row in results] == ["news-1"]
+    assert "news-1" not in [row["id"] for row in search_bm25(old_query, top_k=3, backend="memory", mode="lexical")]
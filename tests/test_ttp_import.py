@@ -0,0 +1,24 @@
+from sqlalchemy import text
+from Database.utils import save_ttp_table, import_ttps
+
+
+def uncategorized_count(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM ttp_table WHERE category IS NULL")).scalar()
+
+
+def test_add_ttps_accepts_several_uncategorized(database):
+    first = save_ttp_table("quét cổng dịch vụ", "", "T1046", "manual")
+    second = save_ttp_table("dò mật khẩu ssh", "", "T1110", "manual")
+    assert first is not None and second is not None
+    assert uncategorized_count(database) == 2
+
+
+def test_file_import_accepts_several_uncategorized(database):
+    rows = [
+        {"pattern": "quét cổng dịch vụ", "category": "", "ttp": "T1046", "source": "file"},
+        {"pattern": "dò mật khẩu ssh", "category": "", "ttp": "T1110", "source": "file"},
+    ]
+    result = import_ttps([rows])
+    assert result == {"inserted": 2, "skipped": 0}
+    assert uncategorized_count(database) == 2